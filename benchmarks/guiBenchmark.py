@@ -0,0 +1,226 @@
+# guiBenchmark.py
+"""
+GUI performance benchmarks, meant for the offscreen Qt platform:
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/guiBenchmark.py [--sizes 10 100 1000 5000] [--compare OLD.json]
+
+For every notebook size it times opening the notebook (Window.open_py_file),
+insert_new_cell, delete_cell, updating row heights after the outputs of the cells
+on screen changed (NotebookView.update_row_heights), save_file, switching to
+the notebook's tab and back, and the latency of a key press in one of its cells,
+both of a letter and of Enter and Backspace, which change the cell's height and
+move every cell below it.
+Every time includes the Qt events the operation left behind (layout, repaint),
+as the user would wait for them too.
+
+Results go to benchmarks/results/<commit>.json unless --output says otherwise;
+--compare prints them next to an earlier results file. Once opening a notebook
+takes longer than --budget seconds the larger sizes are skipped.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from PyQt6 import QtCore
+from PyQt6.QtTest import QTest
+from PyQt6.QtWidgets import QApplication
+
+RESULTS_DIR = os.path.join(REPO, "benchmarks", "results")
+
+
+def make_notebook(folder, cells):
+    """A notebook of cells short cells with a preamble that costs the kernel nothing."""
+    path = os.path.join(folder, f"bench{cells}.py")
+    body = "\n#---\n".join(f"a{i} = {i}\nprint(a{i} * 2)" for i in range(cells))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("#%%---%%\nimport math\n#%%---%%\n" + body)
+    return path
+
+
+def pump(seconds=0.0):
+    end = time.perf_counter() + seconds
+    QApplication.processEvents()
+    while time.perf_counter() < end:
+        QApplication.processEvents()
+        time.sleep(0.005)
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    QApplication.processEvents()
+    return time.perf_counter() - start
+
+
+def summary(times):
+    return {"median": statistics.median(times), "min": min(times), "runs": len(times)}
+
+
+def open_notebook(window, path):
+    window.FileMap.setCurrentIndex(window.fileMapModel.index(path))
+    window.open_py_file()
+    return window.FileViewer.currentWidget()
+
+
+def wait_idle(view, timeout=60):
+    """Wait for the notebook's kernel to finish the preamble, cells can not be deleted while it runs."""
+    end = time.perf_counter() + timeout
+    while view.kernel.is_busy() and time.perf_counter() < end:
+        pump(0.01)
+
+
+def bench_size(main, cells, folder, repeat, results):
+    window = main.Window()
+    window.show()
+    small = open_notebook(window, make_notebook(folder, 10)) if cells != 10 else None
+
+    path = make_notebook(folder, cells)
+    view = None
+
+    def do_open():
+        nonlocal view
+        view = open_notebook(window, path)
+
+    opened = timed(do_open)
+    results[f"open/{cells}"] = summary([opened])
+    wait_idle(view)
+
+    # the outputs of the cells on screen change height, their rows are measured again
+    shown = range(min(20, len(view.notebook)))
+    updates = []
+    for i in range(repeat):
+        for row in shown:
+            view.cell_model.show_output(view.notebook[row], "\n".join(["changed"] * (i % 3 + 1)))
+        updates.append(timed(view.update_row_heights))
+    results[f"update_row_heights/{cells}"] = summary(updates)
+    for row in shown:
+        view.cell_model.show_output(view.notebook[row])
+    timed(view.update_row_heights)
+    results[f"save_file/{cells}"] = summary([timed(lambda: window.save_file(window.FileViewer.indexOf(view))) for _ in range(repeat)])
+
+    # cells are inserted at the end, the same cells are deleted again
+    inserted = []
+    for _ in range(repeat):
+        inserted.append(timed(lambda: window.insert_new_cell(view)))
+    results[f"insert_new_cell/{cells}"] = summary(inserted)
+    deleted = []
+    for _ in range(repeat):
+        editor = view.edit_cell(view.notebook[len(view.notebook) - 1])
+        deleted.append(timed(lambda: window.delete_cell(editor)))
+    results[f"delete_cell/{cells}"] = summary(deleted)
+
+    if small is not None:
+        tabs = window.FileViewer
+        switches = []
+        for _ in range(repeat):
+            switches.append(timed(lambda: tabs.setCurrentWidget(small)))
+            switches.append(timed(lambda: tabs.setCurrentWidget(view)))
+        results[f"tab_switch/{cells}"] = summary(switches)
+
+    # a key press in the middle cell, and everything it sets off before the next key can be handled
+    editor = view.edit_cell(view.notebook[len(view.notebook) // 2])
+    keys = []
+    for _ in range(max(repeat, 20)):
+        keys.append(timed(lambda: QTest.keyClick(editor, QtCore.Qt.Key.Key_X)))
+    results[f"typing/{cells}"] = summary(keys)
+    lines = []
+    for i in range(max(repeat, 20)):
+        key = QtCore.Qt.Key.Key_Return if i % 2 == 0 else QtCore.Qt.Key.Key_Backspace
+        lines.append(timed(lambda: QTest.keyClick(editor, key)))
+    results[f"typing_newline/{cells}"] = summary(lines)
+
+    # typed into, closing would ask whether to save
+    window.save_file(window.FileViewer.indexOf(view))
+    window.flush_pending_saves()
+    window.close()
+    window.deleteLater()
+    pump(0.2)
+    return opened
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def compare(results, previous):
+    old = previous["results"]
+    print(f"{'benchmark':<30} {previous['commit']:>14} {'now':>14}  ratio")
+    for name, now in results.items():
+        if name not in old:
+            print(f"{name:<30} {'-':>14} {now['median'] * 1000:>11.2f} ms")
+            continue
+        before = old[name]["median"]
+        ratio = now["median"] / before if before else float("inf")
+        flag = "  slower" if ratio > 1.1 else "  faster" if ratio < 0.9 else ""
+        print(f"{name:<30} {before * 1000:>11.2f} ms {now['median'] * 1000:>11.2f} ms  {ratio:.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the Pydonia GUI on notebooks of different sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000], help="numbers of cells (default: 10 100 1000 5000)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each operation, the median is reported")
+    parser.add_argument("--budget", type=float, default=120.0, help="skip larger sizes once opening a notebook took longer than this many seconds")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", metavar="OLD", help="earlier results file to compare with")
+    args = parser.parse_args(argv)
+
+    app = QApplication(sys.argv[:1])
+    # the window loads its .ui file and the kernel pool from the repository
+    os.chdir(REPO)
+    import main
+
+    commit = current_commit()
+    results = {}
+    skipped = []
+    over_budget = False
+    with tempfile.TemporaryDirectory() as folder:
+        for cells in sorted(args.sizes):
+            if over_budget:
+                skipped.append(cells)
+                continue
+            opened = bench_size(main, cells, folder, args.repeat, results)
+            print(f"{cells} cells: opened in {opened:.2f} s", file=sys.stderr)
+            over_budget = opened > args.budget
+    if skipped:
+        print(f"skipped {', '.join(map(str, skipped))} cells: over the {args.budget:g} s budget", file=sys.stderr)
+
+    report = {
+        "commit": commit,
+        "created": time.time(),
+        "python": platform.python_version(),
+        "qt": QtCore.QT_VERSION_STR,
+        "platform": QApplication.platformName(),
+        "skipped_sizes": skipped,
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    del app
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# cellCache.py
+"""
+Opt-in memoization of cell results, used by the kernel.
+
+A cell's key is a hash of its source plus fingerprints of the values of the names it
+reads (see cellDeps.analyze). The fingerprint of a function covers its code, defaults,
+closure cells and the globals it reads, so a cell calling f misses once a global f
+uses changes. An entry holds the cell output and the pickled values of
+the names it defined, so a hit restores both without running anything.
+
+Entries live on disk next to the notebook, one pickle per entry in
+.pydonia_cache/<notebook name>/, and are evicted least recently used first once the
+directory grows past max_bytes. Cells whose inputs or results can not be pickled, that
+failed, that star import or that reach names through globals(), eval() and the like
+are never cached.
+"""
+import hashlib
+import importlib
+import marshal
+import os
+import pickle
+import sys
+import types
+from collections import OrderedDict
+
+import cellDeps
+
+CACHE_DIR_NAME = ".pydonia_cache"
+FORMAT_VERSION = 2  # 2: keys include the names a cell reads and rebinds
+
+
+def cache_dir_for(notebook_path):
+    """Directory the cache of a notebook is kept in."""
+    folder, name = os.path.split(os.path.abspath(notebook_path))
+    return os.path.join(folder, CACHE_DIR_NAME, name)
+
+
+class Unfingerprintable(Exception):
+    pass
+
+
+def fingerprint(value, _seen=None):
+    """Bytes that change when value changes."""
+    if isinstance(value, types.ModuleType):
+        return f"module:{value.__name__}:{getattr(value, '__version__', '')}".encode()
+    if isinstance(value, types.FunctionType):
+        return _function_fingerprint(value, set() if _seen is None else _seen)
+    try:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        raise Unfingerprintable()
+
+
+def _code_names(code):
+    """Global and attribute names code reads, including in the functions and comprehensions nested in it."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _function_fingerprint(function, seen):
+    # functions defined in a cell can not be pickled by reference, hash their code instead, and
+    # everything else calling them depends on: defaults, closure cells and the globals they read
+    if id(function) in seen:
+        # recursion, the code is in the fingerprint already
+        return b"function:" + function.__qualname__.encode()
+    seen.add(id(function))
+    parts = [b"function:" + marshal.dumps(function.__code__)]
+
+    def add(label, value):
+        parts.append(label.encode() + b"=" + hashlib.sha256(fingerprint(value, seen)).digest())
+
+    for i, default in enumerate(function.__defaults__ or ()):
+        add(f"default {i}", default)
+    for name, default in sorted((function.__kwdefaults__ or {}).items()):
+        add(f"keyword default {name}", default)
+    for name, cell in zip(function.__code__.co_freevars, function.__closure__ or ()):
+        try:
+            contents = cell.cell_contents
+        except ValueError:
+            parts.append(f"empty cell {name}".encode())
+            continue
+        add(f"closure {name}", contents)
+    namespace = function.__globals__
+    for name in sorted(_code_names(function.__code__)):
+        # attribute names land here too, looking them up only makes the key stricter
+        if name in namespace:
+            add(f"global {name}", namespace[name])
+    return b"\0".join(parts)
+
+
+def dump_value(value):
+    # modules do not pickle, remember them by name and import them again on a hit
+    if isinstance(value, types.ModuleType):
+        return "module", value.__name__
+    return "pickle", pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_value(stored):
+    kind, data = stored
+    if kind == "module":
+        return importlib.import_module(data)
+    return pickle.loads(data)
+
+
+class CellCache:
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size on disk, least recently used first
+        self.total = 0
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        found = []
+        for name in names:
+            if not name.endswith(".pickle"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            found.append((stat.st_mtime, name[:-len(".pickle")], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def key(self, source, namespace):
+        """Cache key of running source in namespace, or None if the cell can not be cached."""
+        info = cellDeps.analyze(source)
+        if info is None or info.star or info.dynamic:
+            return None
+        digest = hashlib.sha256()
+        digest.update(f"{FORMAT_VERSION}:{sys.version}\0".encode())
+        digest.update(source.encode())
+        # a name the cell reads and binds again (x += 1) is an input even where the analysis
+        # saw it bound first, its old value may decide the new one
+        for name in sorted(info.uses | info.rebinds):
+            digest.update(b"\0" + name.encode() + b"=")
+            if name not in namespace:
+                digest.update(b"<missing>")
+                continue
+            try:
+                value_print = fingerprint(namespace[name])
+            except Unfingerprintable:
+                return None
+            digest.update(hashlib.sha256(value_print).digest())
+        return digest.hexdigest()
+
+    def lookup(self, key):
+        """Return (output, {name: value}) for a hit, None for a miss."""
+        if key not in self.entries:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            variables = {name: load_value(stored) for name, stored in entry["variables"].items()}
+        except Exception:
+            # missing, truncated or no longer loadable (e.g. a library changed its pickles)
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["output"], variables
+
+    def store(self, key, source, output, namespace):
+        """Remember the result of a successful run. Returns False if it could not be stored."""
+        info = cellDeps.analyze(source)
+        variables = {}
+        try:
+            for name in info.defines:
+                if name in namespace:
+                    variables[name] = dump_value(namespace[name])
+            data = pickle.dumps({"output": output, "variables": variables}, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return False
+        if len(data) > self.max_bytes:
+            return False
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            return False
+
+        if key in self.entries:
+            self.total -= self.entries[key]
+        self.entries[key] = len(data)
+        self.entries.move_to_end(key)
+        self.total += len(data)
+
+        while self.total > self.max_bytes and self.entries:
+            self._remove(next(iter(self.entries)))
+        return True
+
+    def _remove(self, key):
+        self.total -= self.entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
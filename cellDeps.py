@@ -0,0 +1,263 @@
+# cellDeps.py
+"""
+Def/use analysis of notebook cells, used to rerun only what is out of date.
+
+Each cell is parsed with ast to find the global names it defines and the names it
+reads. A cell depends on the closest earlier cell defining each name it reads,
+which gives a DAG in notebook order. A cell is stale when it never ran, its source
+changed, its last run failed, or one of its upstream cells is stale or ran after it.
+
+The analysis can not see mutation through method calls (lst.append(1)); use
+Restart and Run All when that matters.
+"""
+import ast
+import builtins
+from collections import OrderedDict
+
+BUILTIN_NAMES = frozenset(dir(builtins))
+# reach names without spelling them out, what a cell calling them reads can not be known
+DYNAMIC_NAMES = frozenset({"globals", "locals", "vars", "eval", "exec", "__import__"})
+
+
+class CellInfo:
+    def __init__(self, defines, uses, star=False, imports=frozenset(), rebinds=frozenset(), dynamic=False):
+        self.defines = defines  # global names bound by the cell
+        self.uses = uses  # names read before the cell binds them itself
+        self.star = star  # a star import, the cell may define anything
+        self.imports = imports  # the part of defines bound only by import statements
+        self.rebinds = rebinds  # the part of defines the cell also reads, anywhere in it
+        self.dynamic = dynamic  # calls globals(), eval() and the like, may read any name
+
+
+class _Collector(ast.NodeVisitor):
+    """Walks one top level statement, collecting bound and loaded names."""
+
+    def __init__(self):
+        self.stores = set()
+        self.imported = set()
+        self.loads = set()
+        self.star = False
+        self.depth = 0  # > 0 inside function/class bodies and comprehensions
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.loads.add(node.id)
+        elif self.depth == 0:
+            self.stores.add(node.id)
+
+    def _store_root(self, node):
+        # a[0] = 1 and a.b = 1 change a, count them as a definition of a
+        while isinstance(node, (ast.Attribute, ast.Subscript)):
+            if isinstance(node, ast.Subscript):
+                self.visit(node.slice)
+            node = node.value
+        if isinstance(node, ast.Name):
+            self.loads.add(node.id)
+            if self.depth == 0:
+                self.stores.add(node.id)
+        else:
+            self.visit(node)
+
+    def visit_Attribute(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.generic_visit(node)
+        else:
+            self._store_root(node)
+
+    def visit_Subscript(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.generic_visit(node)
+        else:
+            self._store_root(node)
+
+    def visit_AugAssign(self, node):
+        # x += 1 reads x before it binds it again
+        if isinstance(node.target, ast.Name):
+            self.loads.add(node.target.id)
+            if self.depth == 0:
+                self.stores.add(node.target.id)
+        else:
+            self.visit(node.target)
+        self.visit(node.value)
+
+    def visit_Global(self, node):
+        self.stores.update(node.names)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if self.depth == 0:
+                self.imported.add((alias.asname or alias.name).split(".")[0])
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name == "*":
+                self.star = True
+            elif self.depth == 0:
+                self.imported.add(alias.asname or alias.name)
+
+    def _visit_scope(self, node, name=None):
+        if name is not None and self.depth == 0:
+            self.stores.add(name)
+        for decorator in getattr(node, "decorator_list", []):
+            self.visit(decorator)
+        self.depth += 1
+        for field, value in ast.iter_fields(node):
+            if field == "decorator_list":
+                continue
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+        self.depth -= 1
+
+    def visit_FunctionDef(self, node):
+        self._visit_scope(node, node.name)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self._visit_scope(node, node.name)
+
+    def visit_Lambda(self, node):
+        self._visit_scope(node)
+
+    def visit_ListComp(self, node):
+        self._visit_scope(node)
+
+    visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_ListComp
+
+    def visit_NamedExpr(self, node):
+        # the walrus binds in the enclosing function scope, at top level that is global
+        self.visit(node.value)
+        self.stores.add(node.target.id)
+
+
+def analyze(source: str):
+    """
+    Return the CellInfo of a cell, or None if it does not parse.
+
+    >>> info = analyze("x += 1")
+    >>> sorted(info.uses), sorted(info.defines)
+    (['x'], ['x'])
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+
+    assigned = set()
+    imported = set()
+    uses = set()
+    loads = set()
+    star = False
+    for statement in tree.body:
+        collector = _Collector()
+        collector.visit(statement)
+        # names bound by an earlier statement of the same cell are not inputs
+        uses.update(name for name in collector.loads
+                    if name not in assigned and name not in imported and name not in BUILTIN_NAMES)
+        loads.update(collector.loads)
+        assigned.update(collector.stores)
+        imported.update(collector.imported)
+        star = star or collector.star
+    defines = assigned | imported
+    return CellInfo(defines, uses, star, imported - assigned, defines & loads, bool(loads & DYNAMIC_NAMES))
+
+
+def dependencies(infos):
+    """For every cell, the set of indices of the earlier cells it reads names from."""
+    deps = []
+    latest = {}  # name -> index of the last cell defining it so far
+    star_cells = []
+    for i, info in enumerate(infos):
+        cell_deps = set(star_cells)
+        if info is not None:
+            for name in info.uses:
+                if name in latest:
+                    cell_deps.add(latest[name])
+            for name in info.defines:
+                latest[name] = i
+            if info.star:
+                star_cells.append(i)
+        deps.append(cell_deps)
+    return deps
+
+
+class RunRecord:
+    def __init__(self, source, seq, ok):
+        self.source = source
+        self.seq = seq
+        self.ok = ok
+
+
+class RunTracker:
+    """Remembers what each cell looked like when it last ran in a notebook's kernel."""
+
+    def __init__(self, cache_size=4096):
+        self.records = {}  # cell key -> RunRecord
+        self.seq = 0
+        self.analysis = OrderedDict()  # source -> CellInfo, so unchanged cells are not parsed again
+        self.cache_size = cache_size
+
+    def clear(self):
+        """Forget every run, e.g. after the kernel namespace was thrown away."""
+        self.records.clear()
+
+    def forget(self, key):
+        self.records.pop(key, None)
+
+    def rewind(self, seq):
+        """Forget the runs after seq, e.g. after the kernel went back to a checkpoint taken then."""
+        self.records = {key: record for key, record in self.records.items() if record.seq <= seq}
+
+    def record(self, key, source, ok):
+        self.seq += 1
+        self.records[key] = RunRecord(source, self.seq, ok)
+
+    def analyze(self, source):
+        if source in self.analysis:
+            self.analysis.move_to_end(source)
+            return self.analysis[source]
+        info = analyze(source)
+        self.analysis[source] = info
+        if len(self.analysis) > self.cache_size:
+            self.analysis.popitem(last=False)
+        return info
+
+    def stale(self, cells, target=None):
+        """
+        cells is the notebook in order as (key, source) pairs. Returns the positions of the
+        stale cells, in order. With target, only stale cells target depends on (and target itself).
+
+        >>> tracker = RunTracker()
+        >>> cells = [(1, "x = 1"), (2, "x += 1"), (3, "print(x)")]
+        >>> for key, source in cells:
+        ...     tracker.record(key, source, True)
+        >>> tracker.stale(cells)
+        []
+        >>> tracker.stale([(1, "x = 5")] + cells[1:])
+        [0, 1, 2]
+        """
+        infos = [self.analyze(source) for _, source in cells]
+        deps = dependencies(infos)
+
+        stale = []
+        for i, (key, source) in enumerate(cells):
+            record = self.records.get(key)
+            if record is None or record.source != source or not record.ok or infos[i] is None:
+                stale.append(True)
+                continue
+            stale.append(any(stale[j] or self.records[cells[j][0]].seq > record.seq for j in deps[i]))
+
+        wanted = range(len(cells))
+        if target is not None:
+            wanted = set()
+            todo = [target]
+            while todo:
+                i = todo.pop()
+                if i not in wanted:
+                    wanted.add(i)
+                    todo.extend(deps[i])
+        return [i for i in sorted(wanted) if stale[i]]
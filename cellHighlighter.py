@@ -0,0 +1,171 @@
+# cellHighlighter.py
+"""
+Syntax highlighting of cell source: Python, plus the math keywords of Pydonia
+notation (Integrate, D, and the trivial symbols ^ for powers and _ for
+subscripts, see TODO.txt).
+
+tokenize() works a line at a time. The state a line ends in says whether a
+triple quoted string is still open there, and is where the next line starts
+from. QSyntaxHighlighter keeps that state per block and only highlights a block
+again when it changed, or when the state the block before it ends in changed;
+editing one line does not touch the rest of the cell, and each cell has its own
+document. Brackets are not part of the state: lines inside them may be written
+unindented (matrix rows), so an unmatched one can not be told from a line away,
+and counting them would make every bracket typed highlight the rest of the cell
+again. The notebook view paints the cells that are
+not being edited with the same spans (see NotebookView).
+
+The regexes are compiled once, and the formats are made once and shared by every
+editor and painted cell.
+"""
+import builtins
+import keyword
+import re
+
+from PyQt6 import QtGui
+
+KEYWORDS = frozenset(keyword.kwlist)
+BUILTINS = frozenset(name for name in dir(builtins) if not name.startswith("_"))
+MATH_KEYWORDS = frozenset({"Integrate", "D"})
+
+_TOKEN = re.compile(r"""
+    (?P<comment>\#.*)
+  | (?P<string>(?i:rb|br|fr|rf|[rbuf])?(?:'''|\"\"\"|'(?:[^'\\]|\\.)*(?:'|\\?$)|"(?:[^"\\]|\\.)*(?:"|\\?$)))
+  | (?P<name>[^\W\d]\w*)
+  | (?P<number>0[xXoObB][\da-fA-F_]+|(?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:[eE][+-]?\d+)?[jJ]?)
+  | (?P<power>\^)
+""", re.VERBOSE)
+_DECORATOR = re.compile(r"@[\w.]*")
+_SUBSCRIPT = re.compile(r"(?<=[^\W_])_(?=\d)")  # x_1, the subscript form of a name
+
+# the states a line can end in, besides 0
+IN_SINGLE_QUOTES = 1  # '''
+IN_DOUBLE_QUOTES = 2  # """
+_QUOTES = {IN_SINGLE_QUOTES: "'''", IN_DOUBLE_QUOTES: '"""'}
+
+# Darcula-like colours, the cells are dark
+_STYLES = {
+    "keyword": ("#cc7832", True),
+    "builtin": ("#8888c6", False),
+    "definition": ("#ffc66d", False),
+    "decorator": ("#bbb529", False),
+    "string": ("#6a8759", False),
+    "comment": ("#808080", False),
+    "number": ("#6897bb", False),
+    "math": ("#c77dbb", True),
+}
+_formats = {}
+
+
+def formats():
+    """Text format of each kind of span, made once and shared."""
+    if not _formats:
+        for kind, (color, bold) in _STYLES.items():
+            text_format = QtGui.QTextCharFormat()
+            text_format.setForeground(QtGui.QColor(color))
+            if bold:
+                text_format.setFontWeight(QtGui.QFont.Weight.Bold)
+            _formats[kind] = text_format
+    return _formats
+
+
+def _closing_quotes(text, quotes, position):
+    """Where the triple quotes closing a string are, from position on; -1 if the string goes on below."""
+    while True:
+        found = text.find(quotes, position)
+        if found == -1:
+            return -1
+        backslashes = found - len(text[:found].rstrip("\\"))
+        if backslashes % 2 == 0:
+            return found
+        # \''' is a quote in the string
+        position = found + 1
+
+
+def tokenize(text, state=0):
+    """Spans (start, length, kind) of one line and the state it ends in, given the state of the line before."""
+    spans = []
+    position = 0
+
+    if state:
+        # still inside a triple quoted string from an earlier line
+        end = _closing_quotes(text, _QUOTES[state], 0)
+        if end == -1:
+            if text:
+                spans.append((0, len(text), "string"))
+            return spans, state
+        position = end + 3
+        spans.append((0, position, "string"))
+        state = 0
+
+    stripped = text.lstrip()
+    if not position and stripped.startswith("@"):
+        match = _DECORATOR.match(stripped)
+        spans.append((len(text) - len(stripped), match.end(), "decorator"))
+        position = len(text) - len(stripped) + match.end()
+
+    defining = False
+    while True:
+        match = _TOKEN.search(text, position)
+        if match is None:
+            break
+        kind = match.lastgroup
+        start, position = match.span()
+        if kind == "name":
+            word = match.group()
+            if defining:
+                spans.append((start, position - start, "definition"))
+            elif word in MATH_KEYWORDS:
+                spans.append((start, position - start, "math"))
+            elif word in KEYWORDS:
+                spans.append((start, position - start, "keyword"))
+            elif word in BUILTINS:
+                spans.append((start, position - start, "builtin"))
+            else:
+                for subscript in _SUBSCRIPT.finditer(word):
+                    spans.append((start + subscript.start(), 1, "math"))
+                if word.endswith("_") and text.startswith("{", position):
+                    # x_{n+1}
+                    spans.append((position - 1, 1, "math"))
+            defining = word in ("def", "class")
+            continue
+        defining = False
+        if kind == "string":
+            opener = match.group().lstrip("rRbBuUfF")
+            if opener in ("'''", '"""'):
+                close = _closing_quotes(text, opener, position)
+                if close == -1:
+                    # the string goes on below
+                    spans.append((start, len(text) - start, "string"))
+                    state = IN_SINGLE_QUOTES if opener == "'''" else IN_DOUBLE_QUOTES
+                    break
+                position = close + 3
+            spans.append((start, position - start, "string"))
+        elif kind == "comment":
+            spans.append((start, position - start, "comment"))
+        elif kind == "number":
+            spans.append((start, position - start, "number"))
+        elif kind == "power":
+            spans.append((start, 1, "math"))
+    return spans, state
+
+
+def utf16_spans(text, spans):
+    """Spans with their offsets counted in UTF-16 code units, as Qt counts them."""
+    if text.isascii() or all(ord(char) < 0x10000 for char in text):
+        return spans
+    offsets = [0]
+    for char in text:
+        offsets.append(offsets[-1] + (2 if ord(char) >= 0x10000 else 1))
+    return [(offsets[start], offsets[start + length] - offsets[start], kind) for start, length, kind in spans]
+
+
+class CellHighlighter(QtGui.QSyntaxHighlighter):
+    """Highlights a cell editor's document, see tokenize."""
+
+    def highlightBlock(self, text):
+        spans, state = tokenize(text, max(self.previousBlockState(), 0))
+        kinds = formats()
+        for start, length, kind in utf16_spans(text, spans):
+            self.setFormat(start, length, kinds[kind])
+        self.setCurrentBlockState(state)
@@ -0,0 +1,71 @@
+# cellProfiler.py
+"""
+Profiling a cell inside the kernel.
+
+CellProfiler runs cProfile around the cell and, if asked, a helper thread that
+samples the stack of the cell every few milliseconds. cProfile sees every call
+but slows pure Python code down, so the samples are the better guide when most
+of the time is spent in a few expensive calls.
+
+result() is plain data the kernel pickles to the GUI (see profileView.py),
+its "stats" are what pstats.Stats(...).stats would be and can be written out
+as a .pstats file as they are.
+"""
+import cProfile
+import pstats
+import sys
+import threading
+
+SAMPLE_INTERVAL = 0.005  # seconds, about the interpreter's switch interval
+
+
+class CellProfiler:
+    def __init__(self, filename, sampling=False, interval=SAMPLE_INTERVAL):
+        self.filename = filename  # cell frames are recognised by it
+        self.sampling = sampling
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.samples = {}  # stack of (file, line, function), outermost first -> times seen
+        self.started = False
+        self.target = None  # ident of the thread running the cell
+        self.done = threading.Event()
+        self.sampler = None
+
+    def start(self):
+        """Called by the thread about to run the cell."""
+        self.started = True
+        self.target = threading.get_ident()
+        if self.sampling:
+            self.sampler = threading.Thread(target=self._sample_loop, name="cell-sampler", daemon=True)
+            self.sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.done.set()
+        if self.sampler is not None:
+            self.sampler.join()
+
+    def _sample_loop(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                stack.append(cProfile.label(frame.f_code))
+                if frame.f_code.co_filename == self.filename and frame.f_code.co_name == "<module>":
+                    break
+                frame = frame.f_back
+            else:
+                # between cells or still in the kernel, nothing of the cell to see
+                continue
+            stack = tuple(reversed(stack))
+            self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def result(self):
+        """{"filename", "stats", "samples": [(stack, count)], "interval"}, the profiler's own calls left out."""
+        stats = pstats.Stats(self.profile).stats
+        own_file = self.stop.__code__.co_filename
+        for func in list(stats):
+            if func[0] == own_file or func[2] == "<method 'disable' of '_lsprof.Profiler' objects>":
+                del stats[func]
+        return {"filename": self.filename, "stats": stats, "samples": list(self.samples.items()), "interval": self.interval}
@@ -0,0 +1,109 @@
+# checkpoints.py
+"""
+Bookkeeping for the kernel's fork based checkpoints (Linux only).
+
+After a slow cell the kernel forks. The child is a copy on write snapshot of the
+whole interpreter; it closes the GUI pipes and sleeps on a control socket. To
+restore it the active kernel hands it the GUI pipes (and the control sockets of
+the checkpoints older than it) over that socket and exits, and the child carries
+on as the kernel. Closing the control socket without a message makes a
+checkpoint exit, which is how they are evicted and why they die with the kernel.
+
+Only the pages a checkpoint no longer shares cost memory; those are what the
+budget counts.
+"""
+import os
+import sys
+import time
+
+SUPPORTED = sys.platform.startswith("linux") and hasattr(os, "fork")
+
+MIN_SECONDS = 0.5  # cells faster than this are cheap to replay, no checkpoint for them
+MAX_COUNT = 16
+BUDGET_BYTES = 1024 * 1024 * 1024
+
+
+def private_memory(pid):
+    """Bytes of memory only pid uses (Private_Clean + Private_Dirty), falling back to its RSS."""
+    try:
+        total = 0
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    total += int(line.split()[1]) * 1024
+        return total
+    except (OSError, ValueError, IndexError):
+        pass
+    return resident_memory(pid)
+
+
+def resident_memory(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class Checkpoint:
+    def __init__(self, checkpoint_id, label, pid, control, created=None):
+        self.id = checkpoint_id
+        self.label = label
+        self.pid = pid
+        self.control = control  # socket, our end of the checkpoint's control channel
+        self.created = created or time.time()
+        self.used = time.time()
+
+    def info(self):
+        """What the checkpoint looks like to the GUI, and to the kernel it is handed to."""
+        return {"id": self.id, "label": self.label, "pid": self.pid, "created": self.created,
+                "used": self.used, "memory": private_memory(self.pid), "rss": resident_memory(self.pid)}
+
+    def close(self):
+        """Let the checkpoint go, it exits once it sees its control socket close."""
+        try:
+            self.control.close()
+        except OSError:
+            pass
+        try:
+            os.waitpid(self.pid, 0)
+        except ChildProcessError:
+            # it belonged to a kernel that was replaced, init reaps it
+            pass
+
+
+class Checkpoints:
+    def __init__(self, budget_bytes=BUDGET_BYTES, max_count=MAX_COUNT):
+        self.budget_bytes = budget_bytes
+        self.max_count = max_count
+        self.items = []  # oldest first
+        self.next_id = 1
+
+    def new_id(self):
+        checkpoint_id = self.next_id
+        self.next_id += 1
+        return checkpoint_id
+
+    def get(self, checkpoint_id):
+        return next((cp for cp in self.items if cp.id == checkpoint_id), None)
+
+    def add(self, checkpoint):
+        self.items.append(checkpoint)
+        self.evict()
+
+    def remove(self, checkpoint):
+        if checkpoint in self.items:
+            self.items.remove(checkpoint)
+            checkpoint.close()
+
+    def evict(self):
+        """Drop least recently used checkpoints until both the count and the memory budget hold."""
+        while len(self.items) > self.max_count:
+            self.remove(min(self.items, key=lambda cp: cp.used))
+        while len(self.items) > 1 and sum(private_memory(cp.pid) for cp in self.items) > self.budget_bytes:
+            self.remove(min(self.items, key=lambda cp: cp.used))
+
+    def close_all(self):
+        for checkpoint in self.items:
+            checkpoint.close()
+        self.items = []
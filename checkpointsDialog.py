@@ -0,0 +1,111 @@
+import time
+
+from PyQt6 import QtCore, QtWidgets
+
+from formatting import format_bytes
+
+
+def format_age(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+class CheckpointsDialog(QtWidgets.QDialog):
+    """
+    Lists the checkpoints of a notebook's kernel with their age and memory use.
+    Memory is what the checkpoint does not share with the kernel any more, RSS counts shared pages too.
+    rerun(checkpoint_id) is called to go back to a checkpoint and run the cells after it.
+    """
+    COLUMNS = ["After", "Age", "Memory", "RSS"]
+
+    def __init__(self, kernel, rerun, parent=None):
+        super().__init__(parent)
+        self.kernel = kernel
+        self.rerun = rerun
+        self.setWindowTitle("Checkpoints")
+        self.resize(480, 300)
+
+        self.table = QtWidgets.QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False)
+
+        self.summary = QtWidgets.QLabel()
+
+        rerun_button = QtWidgets.QPushButton("Rerun From Here")
+        rerun_button.clicked.connect(self._rerun_selected)
+        drop_button = QtWidgets.QPushButton("Drop")
+        drop_button.clicked.connect(self._drop_selected)
+        close_button = QtWidgets.QPushButton("Close")
+        close_button.clicked.connect(self.close)
+
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(self.summary)
+        buttons.addStretch()
+        buttons.addWidget(rerun_button)
+        buttons.addWidget(drop_button)
+        buttons.addWidget(close_button)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+
+        # ages and memory change while the dialog is open
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setInterval(2000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start()
+        self.refresh()
+
+    def refresh(self):
+        if self.kernel.is_alive():
+            self.kernel.checkpoints(self._show)
+        else:
+            self._show({"checkpoints": []})
+
+    def _show(self, reply):
+        try:
+            selected = self._selected_id()
+        except RuntimeError:
+            # the dialog was closed before the kernel answered
+            return
+
+        checkpoints = sorted(reply["checkpoints"], key=lambda info: info["created"])
+        now = time.time()
+        self.table.setRowCount(len(checkpoints))
+        for row, info in enumerate(checkpoints):
+            values = [info["label"].strip("<>"), format_age(now - info["created"]),
+                      format_bytes(info["memory"]), format_bytes(info["rss"])]
+            for column, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem(value)
+                item.setData(QtCore.Qt.ItemDataRole.UserRole, info["id"])
+                self.table.setItem(row, column, item)
+            if info["id"] == selected:
+                self.table.selectRow(row)
+
+        total = sum(info["memory"] for info in checkpoints)
+        self.summary.setText(f"{len(checkpoints)} checkpoints, {format_bytes(total)}")
+
+    def _selected_id(self):
+        items = self.table.selectedItems()
+        if not items:
+            return None
+        return items[0].data(QtCore.Qt.ItemDataRole.UserRole)
+
+    def _rerun_selected(self):
+        checkpoint_id = self._selected_id()
+        if checkpoint_id is not None:
+            self.rerun(checkpoint_id)
+            self.close()
+
+    def _drop_selected(self):
+        checkpoint_id = self._selected_id()
+        if checkpoint_id is not None:
+            self.kernel.drop_checkpoint(checkpoint_id)
+            self.refresh()
@@ -0,0 +1,121 @@
+# codeCache.py
+"""
+Content addressed cache of compiled cells.
+
+Code objects are keyed by a hash of the cell's filename and source. They are kept
+in memory and, like .pyc files, marshalled to disk in a __pycache__ folder next to
+the notebook, tagged with the interpreter version so a different Python never
+loads them. Nothing is written when PYTHONDONTWRITEBYTECODE is set.
+
+Every edit of a cell compiles to a new key, so the folder keeps at most
+max_disk_entries files, the least recently used are removed first.
+"""
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+from collections import OrderedDict
+
+MAGIC = importlib.util.MAGIC_NUMBER
+
+
+def code_cache_dir_for(notebook_path):
+    """Directory compiled cells of a notebook are kept in."""
+    folder = os.path.dirname(os.path.abspath(notebook_path))
+    return os.path.join(folder, "__pycache__", "pydonia")
+
+
+class CodeCache:
+    def __init__(self, max_entries=2048, max_disk_entries=4096):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()  # key -> code object
+        self.disk_entries = {}  # directory -> OrderedDict of its file names, least recently used first
+
+    @staticmethod
+    def key(source, filename):
+        return hashlib.sha256(f"{filename}\0{source}".encode()).hexdigest()
+
+    def _path(self, directory, key):
+        return os.path.join(directory, f"{key}.{sys.implementation.cache_tag}.bin")
+
+    def compile(self, source, filename="<string>", directory=None):
+        """compile(source, filename, "exec") through the cache. Raises like compile on bad source."""
+        key = self.key(source, filename)
+        code_obj = self.entries.get(key)
+        if code_obj is not None:
+            self.entries.move_to_end(key)
+            return code_obj
+
+        if directory:
+            code_obj = self._load(directory, key)
+        if code_obj is None:
+            code_obj = compile(source, filename, "exec")
+            if directory and not sys.dont_write_bytecode:
+                self._store(directory, key, code_obj)
+
+        self.entries[key] = code_obj
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return code_obj
+
+    def _disk_entries(self, directory):
+        """The cache files in directory, listed once and then kept up to date."""
+        names = self.disk_entries.get(directory)
+        if names is None:
+            found = []
+            try:
+                for entry in os.scandir(directory):
+                    if entry.name.endswith(".bin"):
+                        try:
+                            found.append((entry.stat().st_mtime, entry.name))
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+            names = self.disk_entries[directory] = OrderedDict((name, None) for _, name in sorted(found))
+        return names
+
+    def _load(self, directory, key):
+        path = self._path(directory, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if data[:len(MAGIC)] != MAGIC:
+            return None
+        try:
+            code_obj = marshal.loads(data[len(MAGIC):])
+        except (EOFError, ValueError, TypeError):
+            return None
+        # recently used, pruned last
+        names = self._disk_entries(directory)
+        names[os.path.basename(path)] = None
+        names.move_to_end(os.path.basename(path))
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return code_obj
+
+    def _store(self, directory, key, code_obj):
+        path = self._path(directory, key)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(MAGIC + marshal.dumps(code_obj))
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        names = self._disk_entries(directory)
+        names[os.path.basename(path)] = None
+        names.move_to_end(os.path.basename(path))
+        while len(names) > self.max_disk_entries:
+            name, _ = names.popitem(last=False)
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
@@ -1,53 +1,304 @@
 # codeCapture.py
-import io
-import traceback
-from contextlib import redirect_stdout, redirect_stderr
 import code
+import io
+import linecache
+import sys
+import threading
 import time
-from PyQt6.QtCore import QThread, pyqtSignal
+import traceback
+
+import pipelineTrace
+from codeCache import CodeCache
+
+
+def reset_peak_memory():
+    """Start measuring the peak RSS of this process from now on. False where that is not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def memory_usage():
+    """(current RSS, peak RSS) of this process in bytes, (None, None) where /proc is not available."""
+    rss = peak = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return rss, peak
+
+
+class Console(code.InteractiveConsole):
+    """InteractiveConsole that remembers whether the last runcode raised."""
+
+    def __init__(self, locals=None):
+        super().__init__(locals=locals)
+        self.failed = False
+
+    def showtraceback(self):
+        self.failed = True
+        super().showtraceback()
+
+    def showsyntaxerror(self, filename=None, **kwargs):
+        self.failed = True
+        super().showsyntaxerror(filename, **kwargs)
+
+
+# what a cell may print, see OutputLimiter
+DEFAULT_OUTPUT_LIMITS = {
+    "chars_per_second": 1_000_000,
+    "writes_per_second": 20_000,
+    "max_chars": 10_000_000,
+}
+
+RATE = "rate"
+VOLUME = "volume"
+
+
+class OutputLimiter:
+    """
+    Keeps a cell's output within limits (see DEFAULT_OUTPUT_LIMITS) so a print in a tight loop
+    can not bury the GUI. A cell may write about one second's worth of the rate limits at once
+    and then keeps to them; nothing is kept past max_chars. What goes over is dropped, and once
+    output is let through again (and when the cell ends) a marker says how much and why.
+
+    Called for every write, so the common cases do no more than a few comparisons: the token
+    buckets are only refilled from the clock once they ran dry, and not on every dropped write.
+    """
 
+    def __init__(self, limits=None):
+        limits = dict(DEFAULT_OUTPUT_LIMITS, **(limits or {}))
+        self.chars_per_second = limits["chars_per_second"]
+        self.writes_per_second = limits["writes_per_second"]
+        self.max_chars = limits["max_chars"]
+        # a write may overdraw the buckets, the writes after it wait
+        self.char_tokens = self.chars_per_second
+        self.write_tokens = self.writes_per_second
+        self.refilled = time.monotonic()
+        self.kept = 0
+        self.dropping = None  # RATE or VOLUME while output is dropped
+        self.dropped_chars = 0  # since the last marker
+        self.dropped_writes = 0
+        self.dropped_total = 0
 
-class CodeCapture(QThread):
-    output = pyqtSignal(str)
-    # finished = pyqtSignal()
+    def limit(self, text):
+        """The part of text to keep, with a marker in front if output was dropped before it."""
+        size = len(text)
+        if self.dropping is None:
+            if self.char_tokens > 0 and self.write_tokens >= 1 and self.kept + size <= self.max_chars:
+                self.char_tokens -= size
+                self.write_tokens -= 1
+                self.kept += size
+                return self.marker() + text if self.dropped_chars else text
+        elif self.dropped_writes & 255:
+            # while dropping, the clock is only looked at every 256 writes
+            self._drop(size)
+            return ""
+        return self._limit_slow(text)
 
-    def __init__(self, console: code.InteractiveConsole, cell_code: str, worker_queue: list, busy_flag: list, wid: int):
+    def _limit_slow(self, text):
+        now = time.monotonic()
+        elapsed, self.refilled = now - self.refilled, now
+        self.char_tokens = min(self.chars_per_second, self.char_tokens + elapsed * self.chars_per_second)
+        self.write_tokens = min(self.writes_per_second, self.write_tokens + elapsed * self.writes_per_second)
+
+        if self.dropping == RATE:
+            # let output through again once half a second's worth came back, not one write at a time
+            if self.char_tokens >= self.chars_per_second / 2 and self.write_tokens >= self.writes_per_second / 2:
+                self.dropping = None
+        elif self.dropping is None and (self.char_tokens <= 0 or self.write_tokens < 1):
+            self.dropping = RATE
+
+        if self.dropping is not None:
+            self._drop(len(text))
+            return ""
+
+        marker = self.marker()
+        kept = text[:self.max_chars - self.kept]
+        if len(kept) < len(text):
+            self.dropping = VOLUME
+            self._drop(len(text) - len(kept))
+        self.kept += len(kept)
+        self.char_tokens -= len(kept)
+        self.write_tokens -= 1
+        return marker + kept
+
+    def _drop(self, size):
+        self.dropped_chars += size
+        self.dropped_writes += 1
+        self.dropped_total += size
+
+    def marker(self):
+        """The note about what was dropped since the last one, "" if nothing was."""
+        if not self.dropped_chars:
+            return ""
+        if self.dropping == VOLUME:
+            reason = f"more than {self.max_chars:,} characters"
+        else:
+            reason = f"over {self.chars_per_second:,} characters or {self.writes_per_second:,} writes a second"
+        marker = f"\n[... {self.dropped_chars:,} characters in {self.dropped_writes:,} writes dropped: output {reason} ...]\n"
+        self.dropped_chars = self.dropped_writes = 0
+        return marker
+
+
+class OutputStream(io.TextIOBase):
+    """
+    stdout/stderr replacement for a running cell. Keeps everything that was written and, if a
+    callback is given, hands the new text to it in chunks: at most once per `interval` seconds
+    while the cell keeps printing, and from a helper thread when it goes quiet.
+    What is kept is limited by an OutputLimiter.
+    """
+
+    def __init__(self, send=None, interval=0.05, limits=None):
         super().__init__()
-        self.cell_code = cell_code
-        self.console = console
-        self.worker_queue = worker_queue
-        self.wid = wid
-        self.busy_flag = busy_flag
-        # self.outputLabel = outputLabel
+        self.send = send
+        self.interval = interval
+        self.parts = []
+        self.pending = []
+        self.lock = threading.Lock()
+        self.limiter = OutputLimiter(limits)
+        self.flush_lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.done = threading.Event()
+        self.flusher = None
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        with self.lock:
+            kept = self.limiter.limit(text)
+            if kept:
+                self.parts.append(kept)
+                self.pending.append(kept)
+        if self.send is not None and time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+        return len(text)
 
-    def run(self):
-        if (not (len(self.worker_queue) == 0)) or self.busy_flag[0]:
-            self.worker_queue.append(self.wid)
+    def flush(self):
+        # flush_lock keeps chunks in order when the cell and the flusher thread flush at once
+        with self.flush_lock:
+            with self.lock:
+                chunk = "".join(self.pending)
+                self.pending.clear()
+                self.last_flush = time.monotonic()
+            if chunk and self.send is not None:
+                pipelineTrace.instant("stream", "kernel", chars=len(chunk))
+                self.send(chunk)
 
-            self.output.emit(". . .")
+    def start(self):
+        if self.send is not None:
+            self.flusher = threading.Thread(target=self._flush_loop, name="output-flusher", daemon=True)
+            self.flusher.start()
 
-            while self.wid in self.worker_queue:
-                time.sleep(.01)
+    def stop(self):
+        self.done.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        with self.lock:
+            marker = self.limiter.marker()
+            if marker:
+                self.parts.append(marker)
+                self.pending.append(marker)
+        self.flush()
 
-        self.busy_flag[0] = True
-        self.output.emit(". . .")
-        time.sleep(.015)
+    def _flush_loop(self):
+        while not self.done.wait(self.interval):
+            self.flush()
+
+    def getvalue(self):
+        with self.lock:
+            return "".join(self.parts)
+
+
+class CodeCapture:
+    """
+    Runs cells one at a time in a shared namespace and captures what they print.
+    Lives inside the kernel process (kernel.py), whose main thread is the only caller.
+
+    After each run last_metrics holds what it cost, in seconds and bytes: compile, wall, cpu and,
+    on Linux, peak_memory (how far the RSS rose above where it started, at its highest while the
+    cell ran) and memory_delta (RSS after - before).
+    output_dropped counts the characters of output the limits held back, if any.
+    """
+
+    def __init__(self):
+        self.console = Console(locals={})
+        self.code_cache = CodeCache()
+        self.last_metrics = {}
+
+    @property
+    def namespace(self):
+        return self.console.locals
+
+    def reset(self):
+        self.console = Console(locals={})
+
+    def run(self, cell_code: str, stream=None, filename="<string>", code_dir=None, profiler=None, output_limits=None):
+        """
+        Compile and run one cell. Returns (status, output) with status "ok" or "error".
+        If stream is given it is called with chunks of output while the cell runs.
+        filename names the cell in tracebacks; compiled code is cached, on disk in code_dir if given.
+        A profiler (see cellProfiler) is started and stopped around the cell's code.
+        output_limits overrides entries of DEFAULT_OUTPUT_LIMITS for this run.
+        """
+        # lets tracebacks show the lines of the cell
+        linecache.cache[filename] = (len(cell_code), None, cell_code.splitlines(True), filename)
+
+        start = time.perf_counter()
+        self.last_metrics = {}
+        try:
+            with pipelineTrace.span("compile", "kernel"):
+                code_obj = self.code_cache.compile(cell_code, filename, code_dir)
+        except Exception as e:
+            self.last_metrics = {"compile": time.perf_counter() - start}
+            return "error", "".join(traceback.format_exception_only(type(e), e))
+        compile_time = time.perf_counter() - start
 
+        peak_known = reset_peak_memory()
+        rss_before, _ = memory_usage()
+        cpu_start = time.process_time()
+        start = time.perf_counter()
 
+        buf = OutputStream(stream, limits=output_limits)
+        self.console.failed = False
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = buf
+        buf.start()
+        if profiler is not None:
+            profiler.start()
         try:
-            code_obj = compile(self.cell_code, "<string>", "exec")
-        except Exception:
-            tb = traceback.format_exc()
-            self.output.emit(tb)
-            return  # stop: can't runcode without code_obj
-
-        buf = io.StringIO()
-        with redirect_stdout(buf), redirect_stderr(buf):
-            try:
+            # runcode reports exceptions (KeyboardInterrupt included) through showtraceback
+            with pipelineTrace.span("exec", "kernel", cell=filename):
                 self.console.runcode(code_obj)
-            except Exception:
-                # runcode may call showtraceback already, but ensure we capture any other
-                buf.write("\n" + traceback.format_exc())
+        except SystemExit:
+            buf.write("\nSystemExit ignored by the Pydonia kernel")
+            self.console.failed = True
+        except BaseException:
+            buf.write("\n" + traceback.format_exc())
+            self.console.failed = True
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+            buf.stop()
 
-        self.output.emit(buf.getvalue())
+        self.last_metrics = {"compile": compile_time, "wall": time.perf_counter() - start, "cpu": time.process_time() - cpu_start}
+        rss_after, peak = memory_usage()
+        if rss_before is not None and rss_after is not None:
+            self.last_metrics["memory_delta"] = rss_after - rss_before
+        if peak_known and peak is not None and rss_before is not None:
+            # the high water mark is the whole process's, only the rise is the cell's
+            self.last_metrics["peak_memory"] = max(0, peak - rss_before)
+        if buf.limiter.dropped_total:
+            self.last_metrics["output_dropped"] = buf.limiter.dropped_total
 
+        return ("error" if self.console.failed else "ok"), buf.getvalue()
@@ -0,0 +1,14 @@
+# formatting.py
+"""Numbers as they are shown to the user, shared by the views and dialogs."""
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def format_seconds(value):
+    return f"{value * 1000:.0f} ms" if value < 1 else f"{value:.2f} s"
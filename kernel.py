@@ -0,0 +1,447 @@
+# kernel.py
+"""
+Pydonia kernel process.
+
+Notebook code runs here instead of inside the GUI process, so a long sympy call
+can not freeze the editor and a crash only takes down the kernel. The GUI
+(see kernelClient.py) starts this file with the same interpreter and talks to
+it over the process stdin/stdout using length-prefixed pickle frames.
+
+Requests:  execute, execute_parallel, complete, interrupt, reset, shutdown,
+           restore, checkpoints, drop_checkpoint, preload
+Replies:   ready, started, stream, result, complete_reply, restored, checkpoints_reply
+
+An execute request may name a cache directory, results are then memoized
+with cellCache (opt-in from the GUI).
+
+Every result carries the metrics of the run (see CodeCapture.last_metrics).
+An execute request with a profile option runs the cell under cellProfiler,
+bypassing the cache, and its result carries the profile. One with trace set
+records pipelineTrace spans while it runs and its result carries them.
+
+What a cell prints is rate and volume limited (see codeCapture.OutputLimiter),
+an execute request's output_limits override the defaults.
+
+Requests are answered in the order they were sent. The main thread is the one
+executor: it sleeps on the request queue while idle and runs cells strictly
+one after another through CodeCapture. While a cell runs, what it prints is
+sent ahead as stream messages, batched by CodeCapture's OutputStream.
+
+execute_parallel carries a batch of cells that may run at the same time on
+forked copies of the kernel (see parallelRun). Their results come back in the
+order they finish. Where fork is not available they run one after another.
+
+An interrupt raises KeyboardInterrupt in the running cell and cancels every
+execute request received before it. Code stuck in C never sees the
+KeyboardInterrupt; the client kills the process in that case.
+
+On Linux an execute request may ask for a checkpoint: if the cell ran long
+enough the kernel forks a sleeping copy of itself once the result is sent (see
+checkpoints.py). restore hands the GUI pipes to such a copy and exits, so the
+copy answers restored with its pid and every later request.
+
+This module only imports the standard library so the GUI can import the frame
+helpers without pulling anything heavy in.
+"""
+import importlib
+import os
+import pickle
+import queue
+import rlcompleter
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import _thread
+
+import checkpoints
+import parallelRun
+import pipelineTrace
+
+from codeCapture import CodeCapture
+from cellCache import CellCache
+from cellProfiler import CellProfiler
+
+FRAME_HEADER = struct.Struct("!I")
+
+
+def write_frame(stream, msg):
+    """Write one length-prefixed pickled message to a binary stream."""
+    payload = pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(FRAME_HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def read_frame(stream):
+    """Read one message written by write_frame. Returns None on EOF."""
+    header = _read_exact(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+    payload = _read_exact(stream, FRAME_HEADER.unpack(header)[0])
+    if payload is None:
+        return None
+    return pickle.loads(payload)
+
+
+def _read_exact(stream, size):
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class Kernel:
+    def __init__(self, proto_in, proto_out):
+        self.proto_in = proto_in
+        self.proto_out = proto_out
+        self.send_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.capture = CodeCapture()
+        self.caches = {}  # cache directory -> CellCache
+        self.executing = False
+        self.last_id = 0  # id of the last request read from the GUI
+        self.cancel_upto = 0  # execute requests up to this id were cancelled by an interrupt
+        self.checkpoints = checkpoints.Checkpoints()
+        self.checkpoint_due = None  # (id, label) of the checkpoint to take once the current request is answered
+        self.own_checkpoint = None  # (id, label, created) of the checkpoint this process was forked as
+        self.restored_by = None  # id of the restore request that woke this process up
+        self.abandoned = ()  # file objects left over from before the fork of a checkpoint
+
+    def send(self, msg):
+        with self.send_lock:
+            write_frame(self.proto_out, msg)
+
+    def read_loop(self):
+        """Runs on a helper thread so interrupts and completions are handled while a cell executes."""
+        while True:
+            try:
+                msg = read_frame(self.proto_in)
+            except Exception:
+                msg = None
+
+            if msg is None:
+                # GUI went away, nothing left to do
+                self.requests.put({"type": "shutdown"})
+                return
+
+            if msg.get("trace"):
+                msg["received"] = time.monotonic()
+            self.last_id = msg.get("id", self.last_id)
+            kind = msg.get("type")
+            if kind == "interrupt":
+                self.interrupt()
+            elif kind == "complete":
+                self.send({"type": "complete_reply", "id": msg["id"], "matches": self.complete(msg["text"])})
+            elif kind == "checkpoints":
+                # answered right away, reading /proc does not need the main thread
+                infos = [checkpoint.info() for checkpoint in list(self.checkpoints.items)]
+                self.send({"type": "checkpoints_reply", "id": msg["id"], "checkpoints": infos})
+            else:
+                self.requests.put(msg)
+                if kind == "shutdown":
+                    return
+
+    def interrupt(self):
+        with self.state_lock:
+            self.cancel_upto = self.last_id
+            # only interrupt while a cell runs, otherwise the KeyboardInterrupt lands in the kernel loop
+            if self.executing:
+                _thread.interrupt_main()
+
+    def complete(self, text):
+        completer = rlcompleter.Completer(self.capture.namespace)
+        matches = []
+        state = 0
+        try:
+            while True:
+                match = completer.complete(text, state)
+                if match is None:
+                    break
+                matches.append(match)
+                state += 1
+        except Exception:
+            pass
+        return matches
+
+    def preload(self, modules):
+        """Import modules ahead of the cells that need them, without touching the namespace."""
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                # the cell importing it reports the problem
+                pass
+
+    def cache_for(self, directory):
+        if not directory:
+            return None
+        if directory not in self.caches:
+            self.caches[directory] = CellCache(directory)
+        return self.caches[directory]
+
+    def execute(self, msg):
+        # checked under the same lock interrupt() takes, so a cell is either cancelled or interruptible
+        with self.state_lock:
+            cancelled = msg["id"] <= self.cancel_upto
+            self.executing = not cancelled
+        if cancelled:
+            self.send({"type": "result", "id": msg["id"], "status": "cancelled", "output": "Cancelled"})
+            return
+
+        traced = msg.get("trace", False)
+        if traced:
+            pipelineTrace.start()
+            pipelineTrace.name_process(f"Pydonia kernel {os.getpid()}")
+            pipelineTrace.complete("kernel queue", msg.get("received", time.monotonic()), cat="kernel")
+        begin = time.monotonic()
+
+        self.send({"type": "started", "id": msg["id"]})
+        profiler = None
+        if msg.get("profile") is not None:
+            profiler = CellProfiler(msg.get("filename", "<string>"), **msg["profile"])
+        start = time.perf_counter()
+        self.capture.last_metrics = {}
+        try:
+            status, output, cached = self._execute(msg, profiler)
+        except KeyboardInterrupt:
+            # interrupted outside the user code, e.g. while looking in the cache
+            status, output, cached = "error", "KeyboardInterrupt", False
+        finally:
+            with self.state_lock:
+                self.executing = False
+        elapsed = time.perf_counter() - start
+
+        metrics = {"wall": elapsed} if cached else dict(self.capture.last_metrics)
+        reply = {"type": "result", "id": msg["id"], "status": status, "output": output, "cached": cached, "metrics": metrics}
+        if profiler is not None and profiler.started:
+            reply["profile"] = profiler.result()
+        if traced:
+            pipelineTrace.complete("execute", begin, cat="kernel", cell=msg.get("filename", "<string>"), status=status, cached=cached)
+            reply["trace"] = pipelineTrace.drain()
+            pipelineTrace.stop()
+        if (msg.get("checkpoint") and checkpoints.SUPPORTED and status == "ok"
+                and elapsed >= checkpoints.MIN_SECONDS):
+            reply["checkpoint"] = self.checkpoints.new_id()
+            self.checkpoint_due = (reply["checkpoint"], msg.get("filename", "<string>"))
+        self.send(reply)
+
+    def execute_parallel(self, msg):
+        cells = msg["cells"]
+        if not hasattr(os, "fork"):
+            for cell in cells:
+                self.execute(cell)
+            return
+
+        with self.state_lock:
+            cancelled = msg["id"] <= self.cancel_upto
+            self.executing = not cancelled
+        if cancelled:
+            for cell in cells:
+                self.send({"type": "result", "id": cell["id"], "status": "cancelled", "output": "Cancelled"})
+            return
+
+        try:
+            parallelRun.ParallelRun(self, cells).run()
+        finally:
+            with self.state_lock:
+                self.executing = False
+
+    def _execute(self, msg, profiler=None):
+        # a profile of a cache hit would be empty
+        cache = self.cache_for(msg.get("cache_dir")) if profiler is None else None
+        key = cache.key(msg["code"], self.capture.namespace) if cache is not None else None
+        if key is not None:
+            with pipelineTrace.span("cache lookup", "kernel"):
+                hit = cache.lookup(key)
+            if hit is not None:
+                output, variables = hit
+                self.capture.namespace.update(variables)
+                return "ok", output, True
+
+        stream = None
+        if msg.get("stream"):
+            stream = lambda text: self.send({"type": "stream", "id": msg["id"], "text": text})
+        status, output = self.capture.run(msg["code"], stream, msg.get("filename", "<string>"), msg.get("code_dir"), profiler,
+                                          msg.get("output_limits"))
+
+        if key is not None and status == "ok":
+            cache.store(key, msg["code"], output, self.capture.namespace)
+        return status, output, False
+
+    def checkpoint(self, checkpoint_id, label):
+        """
+        Fork a sleeping copy of the kernel as it is now. Returns at once in the kernel; in the copy
+        it only returns once the copy was restored and took over as the kernel.
+        """
+        restored = False
+        while self._fork_checkpoint(checkpoint_id, label):
+            # we are the copy and just took over, leave a fresh copy of the same state behind
+            # before any thread starts, so the checkpoint can be restored again
+            restored = True
+        if restored:
+            threading.Thread(target=self.read_loop, name="kernel-reader", daemon=True).start()
+            self.send({"type": "restored", "id": self.restored_by, "ok": True, "pid": os.getpid()})
+
+    def _fork_checkpoint(self, checkpoint_id, label):
+        # a restored copy leaving a copy of itself behind keeps the age of the state
+        if self.own_checkpoint is not None and self.own_checkpoint[0] == checkpoint_id:
+            created = self.own_checkpoint[2]
+        else:
+            created = time.time()
+
+        ours, theirs = socket.socketpair()
+        # nobody may be half way through a frame or a state change in the copy
+        with self.send_lock, self.state_lock:
+            pid = os.fork()
+        if pid:
+            theirs.close()
+            self.checkpoints.add(checkpoints.Checkpoint(checkpoint_id, label, pid, ours, created))
+            return False
+
+        ours.close()
+        self.own_checkpoint = (checkpoint_id, label, created)
+        return self._sleep(theirs)
+
+    def _sleep(self, control):
+        """The forked copy waits here until it is restored (True) or let go (exits)."""
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # the GUI pipes and the other checkpoints belong to the running kernel, holding on to them
+        # would hide its death from the GUI and from the checkpoints. The old file objects are never
+        # touched again (the reader thread may have held their locks when we forked), their fds are
+        # pointed at /dev/null so nothing else can be closed through them
+        devnull = os.open(os.devnull, os.O_RDWR)
+        os.dup2(devnull, self.proto_in.fileno())
+        os.dup2(devnull, self.proto_out.fileno())
+        os.close(devnull)
+        self.abandoned = (self.proto_in, self.proto_out)
+        for other in self.checkpoints.items:
+            other.control.close()
+        self.checkpoints.items = []
+
+        try:
+            data, fds, _, _ = socket.recv_fds(control, 1 << 20, 1024)
+        except OSError:
+            data = b""
+        if not data:
+            os._exit(0)
+        control.close()
+
+        wake = pickle.loads(data)
+        # the old kernel's reader thread must be gone before ours starts reading the same pipe
+        try:
+            pidfd = os.pidfd_open(wake["pid"])
+        except (AttributeError, OSError):
+            pass
+        else:
+            select.select([pidfd], [], [], 5)
+            os.close(pidfd)
+
+        in_fd, out_fd, *control_fds = fds
+        self.proto_in = os.fdopen(in_fd, "rb")
+        self.proto_out = os.fdopen(out_fd, "wb")
+        self.send_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.executing = False
+        self.cancel_upto = self.last_id = wake["id"]
+        self.restored_by = wake["id"]
+        self.checkpoints.next_id = wake["next_id"]
+        for info, fd in zip(wake["checkpoints"], control_fds):
+            older = checkpoints.Checkpoint(info["id"], info["label"], info["pid"], socket.socket(fileno=fd), info["created"])
+            older.used = info["used"]
+            self.checkpoints.items.append(older)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        return True
+
+    def restore(self, msg):
+        """Hand the GUI over to a checkpoint and exit. Checkpoints newer than it are let go."""
+        checkpoint = self.checkpoints.get(msg.get("checkpoint_id"))
+        if checkpoint is None:
+            self.send({"type": "restored", "id": msg["id"], "ok": False, "pid": os.getpid()})
+            return
+
+        checkpoint.used = time.time()
+        older = [other for other in self.checkpoints.items if other.created < checkpoint.created]
+        wake = {"id": msg["id"], "pid": os.getpid(), "next_id": self.checkpoints.next_id, "checkpoints": [other.info() for other in older]}
+        fds = [self.proto_in.fileno(), self.proto_out.fileno()] + [other.control.fileno() for other in older]
+        with self.send_lock:
+            try:
+                socket.send_fds(checkpoint.control, [pickle.dumps(wake)], fds)
+            except OSError:
+                # it died (e.g. killed by the OOM killer), carry on as we were
+                self.checkpoints.remove(checkpoint)
+                write_frame(self.proto_out, {"type": "restored", "id": msg["id"], "ok": False, "pid": os.getpid()})
+                return
+        # the checkpoints that were not handed over see their control sockets close and exit
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
+
+    def serve(self):
+        threading.Thread(target=self.read_loop, name="kernel-reader", daemon=True).start()
+        self.send({"type": "ready", "pid": os.getpid()})
+
+        while True:
+            try:
+                msg = self.requests.get()
+                kind = msg.get("type")
+                if kind == "shutdown":
+                    self.checkpoints.close_all()
+                    return
+                elif kind == "execute":
+                    self.execute(msg)
+                elif kind == "execute_parallel":
+                    self.execute_parallel(msg)
+                elif kind == "reset":
+                    self.capture.reset()
+                    self.checkpoints.close_all()
+                elif kind == "preload":
+                    self.preload(msg["modules"])
+                elif kind == "restore":
+                    self.restore(msg)
+                elif kind == "drop_checkpoint":
+                    checkpoint = self.checkpoints.get(msg.get("checkpoint_id"))
+                    if checkpoint is not None:
+                        self.checkpoints.remove(checkpoint)
+
+                if self.checkpoint_due is not None:
+                    checkpoint_id, label = self.checkpoint_due
+                    self.checkpoint_due = None
+                    self.checkpoint(checkpoint_id, label)
+            except KeyboardInterrupt:
+                # an interrupt that arrived just after the cell finished, or a Ctrl+C in the launching terminal
+                continue
+
+
+def main():
+    # Keep private copies of the pipes for the protocol and point the real stdin/stdout somewhere
+    # harmless, so input() or a stray print from a C extension can not corrupt the frames.
+    proto_in = os.fdopen(os.dup(0), "rb")
+    proto_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
+
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    kernel = Kernel(proto_in, proto_out)
+    kernel.serve()
+    if kernel.restored_by is not None:
+        # a restored checkpoint still holds file objects from before the fork, do not let
+        # interpreter shutdown try to close them
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# kernelClient.py
+import collections
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+import kernel
+import pipelineTrace
+
+KERNEL_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel.py")
+
+
+def spawn_kernel(cwd=None, preload=()):
+    """Start a kernel process. preload names modules it imports before anything else it is sent."""
+    proc = subprocess.Popen(
+        [sys.executable, KERNEL_SCRIPT],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        cwd=cwd,
+    )
+    if preload:
+        kernel.write_frame(proc.stdin, {"type": "preload", "modules": list(preload)})
+    return proc
+
+
+class ExecutionRequest:
+    def __init__(self, msg_id, cell_code, on_done, on_stream):
+        self.id = msg_id
+        self.cell_code = cell_code
+        self.on_done = on_done
+        self.on_stream = on_stream
+        self.proc = None  # kernel process the request was sent to
+        self.timed_out = False
+        self.options = {}
+        self.sent = time.monotonic()
+        self.started = None  # time.monotonic() when the kernel began running it
+
+
+class KernelClient(QObject):
+    """
+    GUI side of a kernel process (see kernel.py).
+    Every notebook tab owns one. Cells are queued with execute(); the kernel runs them in order and
+    the completion callbacks are called on the GUI thread in the same order. Nothing polls: one reader
+    thread blocks on the kernel's stdout and hands each message to the GUI thread through a signal.
+
+    The process is started lazily and restarted on the next request if it dies; `died` is emitted so
+    the window can tell the user and rerun the preamble. With a pool (see kernelPool.py) the process
+    is taken from it instead, already warm.
+
+    A cell running longer than time_limit seconds is interrupted. If an interrupt is not answered
+    within kill_grace seconds (code stuck in C does not see KeyboardInterrupt) the process is killed.
+
+    restore() swaps the kernel for one of its checkpoints, a different process on the same pipes.
+    Nothing else is written to the pipe until the checkpoint answered, and pid follows it.
+    """
+    died = pyqtSignal(int)
+    messageReceived = pyqtSignal(object)
+
+    def __init__(self, cwd: str | None = None, pool=None):
+        super().__init__()
+        self.cwd = cwd
+        self.pool = pool  # pool kernels run in the GUI's working directory, so only used without cwd
+        self.proc = None
+        self.pid = None
+        self.closing = False
+        self.send_lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.execution_queue = collections.deque()  # ExecutionRequests sent and not yet answered, oldest first
+        self.completions = {}
+        self.replies = {}  # msg id -> callback(reply) of restore and checkpoints requests
+        self.held = None  # messages waiting for a restore to finish, None when not restoring
+        self.disconnected = threading.Event()
+        self.messageReceived.connect(self._on_message)
+
+        self.time_limit = None  # seconds, None for no limit
+        self.kill_grace = 3.0
+        self.running = None  # the request the kernel is executing right now
+        self.interrupted_upto = 0  # requests up to this id must be answered before kill_timer fires
+        self.exit_reason = None
+        self.deadline_timer = QTimer(self)
+        self.deadline_timer.setSingleShot(True)
+        self.deadline_timer.timeout.connect(self._on_deadline)
+        self.kill_timer = QTimer(self)
+        self.kill_timer.setSingleShot(True)
+        self.kill_timer.timeout.connect(self._on_kill_timeout)
+
+    def start(self):
+        """Start the kernel process if it is not already running."""
+        if self.is_alive():
+            return
+        self.closing = False
+        self.exit_reason = None
+        self.held = None
+        self.disconnected = threading.Event()
+        if self.pool is not None and self.cwd is None:
+            self.proc = self.pool.take()
+        else:
+            self.proc = spawn_kernel(self.cwd)
+        self.pid = self.proc.pid
+        reader = threading.Thread(target=self._read_loop, args=(self.proc, self.disconnected), name="kernel-client-reader", daemon=True)
+        reader.start()
+
+    def is_alive(self):
+        # not proc.poll(): after a restore the process we started is gone but its checkpoint holds the pipes
+        return self.proc is not None and not self.disconnected.is_set()
+
+    def is_busy(self):
+        """True while any cell of this kernel is running or waiting to run."""
+        return len(self.execution_queue) > 0
+
+    def _send(self, msg):
+        self.start()
+        if self.held is not None:
+            self.held.append(msg)
+            return
+        with self.send_lock:
+            try:
+                kernel.write_frame(self.proc.stdin, msg)
+            except (BrokenPipeError, OSError, ValueError):
+                # the reader thread notices the dead process and fails the queued requests
+                pass
+
+    def _read_loop(self, proc, disconnected):
+        while True:
+            try:
+                msg = kernel.read_frame(proc.stdout)
+            except Exception:
+                msg = None
+            if msg is None:
+                break
+            if pipelineTrace.enabled:
+                msg["received"] = time.monotonic()
+            try:
+                self.messageReceived.emit(msg)
+            except RuntimeError:
+                # the client itself was deleted, e.g. while the application quits
+                return
+
+        disconnected.set()
+        # goes through the same signal so it is handled after every reply the kernel managed to send
+        try:
+            self.messageReceived.emit({"type": "exit", "proc": proc, "code": proc.wait()})
+        except RuntimeError:
+            # the client itself was deleted, e.g. while the application quits
+            pass
+
+    def _on_message(self, msg):
+        kind = msg.get("type")
+        if "received" in msg:
+            # how long the message waited for the GUI thread
+            pipelineTrace.complete(f"signal {kind}", msg["received"], cat="kernel client")
+        if kind == "ready":
+            self.pid = msg["pid"]
+        elif kind == "started":
+            self.running = self._find_request(msg["id"])
+            if self.running is not None:
+                self.running.started = time.monotonic()
+                pipelineTrace.complete("queued", self.running.sent, self.running.started, cat="kernel client",
+                                       cell=self.running.options.get("filename", "<string>"))
+                if self.time_limit:
+                    self.deadline_timer.start(int(self.time_limit * 1000))
+        elif kind == "stream":
+            request = self._find_request(msg["id"])
+            if request is not None and request.on_stream is not None:
+                request.on_stream(msg["text"])
+        elif kind == "result":
+            # replies come back in request order, so this is the oldest request unless a
+            # previous kernel died with requests still queued
+            request = self._find_request(msg["id"])
+            if request is None:
+                return
+            if request is self.execution_queue[0]:
+                self.execution_queue.popleft()
+            else:
+                self.execution_queue.remove(request)
+            if request is self.running:
+                self.running = None
+                self.deadline_timer.stop()
+            if not self._waiting_on_interrupt():
+                self.kill_timer.stop()
+            if "trace" in msg:
+                pipelineTrace.add(msg.pop("trace"))
+            if request.timed_out:
+                msg = dict(msg, output=msg["output"] + f"\nStopped: the cell ran longer than the {self.time_limit:g} s time limit")
+            if request.started is not None and "metrics" in msg:
+                # time spent behind other cells, measured here since the kernel never sees it queued in the pipe
+                msg["metrics"]["queue_wait"] = request.started - request.sent
+            if request.on_done is not None:
+                request.on_done(msg)
+        elif kind == "complete_reply":
+            callback = self.completions.pop(msg["id"], None)
+            if callback is not None:
+                callback(msg["matches"])
+        elif kind in ("restored", "checkpoints_reply"):
+            if kind == "restored":
+                self.pid = msg["pid"]
+                held, self.held = self.held or [], None
+                for held_msg in held:
+                    self._send(held_msg)
+            callback = self.replies.pop(msg["id"], None)
+            if callback is not None:
+                callback(msg)
+        elif kind == "exit":
+            self._on_exit(msg["proc"], msg["code"])
+
+    def _find_request(self, msg_id):
+        if self.execution_queue and self.execution_queue[0].id == msg_id:
+            return self.execution_queue[0]
+        return next((r for r in self.execution_queue if r.id == msg_id), None)
+
+    def _on_exit(self, proc, exit_code):
+        # kernel is gone: fail everything that was waiting on it
+        lost = [request for request in self.execution_queue if request.proc is proc]
+        self.execution_queue = collections.deque(r for r in self.execution_queue if r.proc is not proc)
+        reason = f"Kernel died (exit code {exit_code}). It will be restarted."
+        if proc is self.proc:
+            if self.pid != proc.pid:
+                # it was a restored checkpoint, not the process we started, its exit code is unknown
+                exit_code = -1
+            self.completions.clear()
+            self.replies.clear()
+            self.held = None
+            self.running = None
+            self.deadline_timer.stop()
+            self.kill_timer.stop()
+            reason = self.exit_reason or reason
+        for request in lost:
+            if request.on_done is not None:
+                request.on_done({"type": "result", "id": request.id, "status": "error", "output": reason})
+
+        if not self.closing:
+            self.died.emit(exit_code)
+
+    def execute(self, cell_code: str, on_done=None, on_stream=None, **options):
+        """
+        Queue a cell. on_done(reply) is called on the GUI thread once it has run, and
+        on_stream(text) with chunks of its output while it runs.
+        options go into the request as they are:
+            filename   name of the cell in tracebacks
+            code_dir   where the kernel keeps compiled cells on disk (see codeCache)
+            cache_dir  memoize the result there (see cellCache)
+            profile    run it under cellProfiler, e.g. {"sampling": True}; the reply carries the profile
+            output_limits  entries of codeCapture.DEFAULT_OUTPUT_LIMITS to use instead
+        """
+        request = ExecutionRequest(next(self.ids), cell_code, on_done, on_stream)
+        request.options = options
+        self.execution_queue.append(request)
+        msg = dict(options, type="execute", id=request.id, code=cell_code, stream=on_stream is not None)
+        if pipelineTrace.enabled:
+            msg["trace"] = True
+        self._send(msg)
+        request.proc = self.proc
+        return request
+
+    def execute_parallel(self, cells):
+        """
+        Queue a batch of cells the kernel may run at the same time (see parallelRun). cells is a
+        list of (cell_code, on_done, options), options as for execute(); on_done is called in the
+        order the cells finish.
+        The time limit does not apply to a parallel batch, interrupt() does.
+        """
+        requests = []
+        for cell_code, on_done, options in cells:
+            request = ExecutionRequest(next(self.ids), cell_code, on_done, None)
+            request.options = options
+            self.execution_queue.append(request)
+            requests.append(request)
+        if not requests:
+            return requests
+
+        self._send({"type": "execute_parallel", "id": requests[-1].id,
+                    "cells": [dict(r.options, id=r.id, code=r.cell_code) for r in requests]})
+        for request in requests:
+            request.proc = self.proc
+        return requests
+
+    def complete(self, text: str, callback):
+        """Ask for completions of text. callback(matches) is called on the GUI thread."""
+        msg_id = next(self.ids)
+        self.completions[msg_id] = callback
+        self._send({"type": "complete", "id": msg_id, "text": text})
+
+    def checkpoints(self, callback):
+        """Ask for the kernel's checkpoints. callback(reply) gets a list of dicts in reply["checkpoints"]."""
+        msg_id = next(self.ids)
+        self.replies[msg_id] = callback
+        self._send({"type": "checkpoints", "id": msg_id})
+
+    def restore(self, checkpoint_id, callback=None):
+        """
+        Go back to a checkpoint. Cells queued before run first. callback(reply) is called on the GUI
+        thread, reply["ok"] is False if the checkpoint is gone (the kernel then stays as it was).
+        """
+        msg_id = next(self.ids)
+        if callback is not None:
+            self.replies[msg_id] = callback
+        self._send({"type": "restore", "id": msg_id, "checkpoint_id": checkpoint_id})
+        if self.held is None:
+            self.held = []
+
+    def drop_checkpoint(self, checkpoint_id):
+        self._send({"type": "drop_checkpoint", "checkpoint_id": checkpoint_id})
+
+    def _on_deadline(self):
+        if self.running is not None:
+            self.running.timed_out = True
+            self.interrupt()
+
+    def _waiting_on_interrupt(self):
+        # requests are queued in id order, so checking the oldest one is enough
+        return bool(self.execution_queue) and self.execution_queue[0].id <= self.interrupted_upto
+
+    def _on_kill_timeout(self):
+        if self._waiting_on_interrupt():
+            self.kill("Kernel did not respond to the interrupt and was restarted.")
+
+    def interrupt(self):
+        """Stop the running cell and cancel the queued ones, killing the kernel if it does not respond."""
+        if not self.is_alive() or not self.execution_queue:
+            return
+        self.interrupted_upto = self.execution_queue[-1].id
+        self._send({"type": "interrupt"})
+        self.kill_timer.start(int(self.kill_grace * 1000))
+
+    def kill(self, reason=None):
+        """Kill the kernel process right away. Queued cells fail with reason and `died` is emitted."""
+        if self.is_alive():
+            self.exit_reason = reason
+            if self.pid != self.proc.pid:
+                try:
+                    os.kill(self.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            self.proc.kill()
+
+    def reset(self):
+        """Throw away the notebook namespace, like creating a new InteractiveConsole."""
+        self._send({"type": "reset"})
+
+    def shutdown(self):
+        """Ask the kernel to exit, killing it if it does not listen."""
+        self.closing = True
+        # nobody is left to show the results
+        self.execution_queue.clear()
+        self.completions.clear()
+        self.replies.clear()
+        self.held = None
+        if not self.is_alive():
+            return
+        self._send({"type": "shutdown"})
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        if not self.disconnected.wait(1):
+            self.kill()
@@ -0,0 +1,85 @@
+import time
+
+from PyQt6 import QtCore, QtWidgets
+
+
+class KernelMonitor(QtWidgets.QWidget):
+    """
+    What every open notebook's kernel is doing: its pid, the cell it runs and for how long,
+    and how many cells wait behind it. notebooks() returns (name, KernelClient) pairs.
+    Refreshed twice a second while visible.
+    """
+    COLUMNS = ["Notebook", "PID", "State", "Queued"]
+
+    def __init__(self, notebooks, parent=None):
+        super().__init__(parent)
+        self.notebooks = notebooks
+        self.kernels = []  # KernelClient of each row
+
+        self.table = QtWidgets.QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(2, QtWidgets.QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+
+        interrupt_button = QtWidgets.QPushButton("Interrupt")
+        interrupt_button.clicked.connect(self._interrupt_selected)
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(interrupt_button)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setInterval(500)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    @staticmethod
+    def describe(kernel):
+        """(state, number of queued cells) of a KernelClient."""
+        if kernel.proc is None:
+            return "not started", 0
+        if not kernel.is_alive():
+            return "stopped", 0
+
+        queued = len(kernel.execution_queue)
+        request = kernel.running
+        if request is None:
+            # a parallel batch sends no per cell started messages
+            return ("busy" if queued else "idle"), queued
+        name = request.options.get("filename", "cell").strip("<>")
+        elapsed = time.monotonic() - request.started
+        return f"running {name} for {elapsed:.1f} s", queued - 1
+
+    def refresh(self):
+        rows = list(self.notebooks())
+        self.kernels = [kernel for _, kernel in rows]
+        self.table.setRowCount(len(rows))
+        for row, (name, kernel) in enumerate(rows):
+            state, queued = self.describe(kernel)
+            values = [name, str(kernel.pid or ""), state, str(queued) if queued else ""]
+            for column, value in enumerate(values):
+                item = self.table.item(row, column)
+                if item is None:
+                    self.table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+                elif item.text() != value:
+                    item.setText(value)
+
+    def _interrupt_selected(self):
+        rows = self.table.selectionModel().selectedRows()
+        if rows and rows[0].row() < len(self.kernels):
+            self.kernels[rows[0].row()].interrupt()
@@ -0,0 +1,66 @@
+# kernelPool.py
+import subprocess
+
+from PyQt6.QtCore import QObject, QTimer
+
+import kernelClient
+
+
+class KernelPool(QObject):
+    """
+    Kernel processes started ahead of time, so opening a notebook does not wait for Python to start
+    and import sympy. Each spare is asked to import the preload modules as soon as it starts (into
+    sys.modules only, the notebook namespace stays empty), and a KernelClient given the pool takes
+    one instead of starting a process itself. A spare taken is replaced refill_delay ms later, once
+    the new notebook had the CPU for its first cells.
+
+    Spares that were never taken exit with the GUI: shutdown() closes their stdin, and so does the
+    GUI dying.
+    """
+
+    def __init__(self, preload=(), size=1, refill_delay=1000, parent=None):
+        super().__init__(parent)
+        self.preload = list(preload)
+        self.size = size
+        self.spares = []  # Popen objects, oldest first
+        self.refill_timer = QTimer(self)
+        self.refill_timer.setSingleShot(True)
+        self.refill_timer.setInterval(refill_delay)
+        self.refill_timer.timeout.connect(self.fill)
+
+    def set_preload(self, preload):
+        """Preload these modules from now on; spares started with the old list are replaced."""
+        self.preload = list(preload)
+        self.shutdown()
+        self.fill()
+
+    def fill(self):
+        """Start spares until there are size of them."""
+        self.spares = [proc for proc in self.spares if proc.poll() is None]
+        while len(self.spares) < self.size:
+            self.spares.append(kernelClient.spawn_kernel(preload=self.preload))
+
+    def take(self):
+        """A started kernel process, warm if a spare was ready."""
+        while self.spares:
+            proc = self.spares.pop(0)
+            if proc.poll() is None:
+                break
+        else:
+            proc = kernelClient.spawn_kernel(preload=self.preload)
+        self.refill_timer.start()
+        return proc
+
+    def shutdown(self):
+        self.refill_timer.stop()
+        for proc in self.spares:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+        for proc in self.spares:
+            try:
+                proc.wait(1)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.spares = []
@@ -5,10 +5,25 @@ from PyQt6.QtWidgets import QApplication, QMainWindow, QSplitter
 from PyQt6.uic import loadUi
 import sys
 import os
-import code
+import json
+import time
 
 from terminalWidget import TerminalWidget
-from codeCapture import CodeCapture
+from kernelClient import KernelClient
+from kernelPool import KernelPool
+from kernelMonitor import KernelMonitor
+from cellDeps import RunTracker
+from cellCache import cache_dir_for
+from codeCache import code_cache_dir_for
+from checkpointsDialog import CheckpointsDialog
+import checkpoints
+from notebookModel import DEFAULT_PREAMBLE, Notebook, preamble_imports
+from codeCapture import DEFAULT_OUTPUT_LIMITS
+from profileView import ProfileView
+from pagedTextView import LARGE_FILE, PagedTextView
+from notebookView import NotebookView
+import outputSpool
+import pipelineTrace
 from textEditWidget import TextEdit
 # import mathImports
 
@@ -16,11 +31,14 @@ from textEditWidget import TextEdit
 class Window(QMainWindow):
     def __init__(self):
         self.terminalNum = 0
-        self.default_preamble = "#%%---%%\n# Warning: portions of this code were automatically generated by Pydonia\n# attempting to edit the raw Python code may lead to undefined behavior\n# upon loading back into a Pydonia environment\nimport sympy as sp\n\nx, y, z = sp.symbols(\"x y z\")\n#%%---%%\n"
-        self.workers = {}
-        self.worker_counter = 0
-        self.worker_queue = []
-        self.busy_flag = [False]
+        self.streamed_outputs = {}  # cell -> text printed so far by the running cell
+        self.output_spool = outputSpool.OutputSpool()  # outputs too long for their label
+        self.dirty_outputs = set()
+        self.cell_time_limit = None  # seconds a cell may run before it is interrupted, None for no limit
+        self.output_limits = dict(DEFAULT_OUTPUT_LIMITS)  # what a cell may print, see codeCapture.OutputLimiter
+        self.default_preamble = DEFAULT_PREAMBLE
+        # imported by spare kernels before a notebook gets them, Run > Preload Modules
+        self.preload_modules = preamble_imports(self.default_preamble)
 
         super(Window, self).__init__()
         loadUi("./pydoniaMainWindow.ui", self)
@@ -40,6 +58,12 @@ class Window(QMainWindow):
         # Add widgets to the splitter
         self.ToolsSplitter.addWidget(self.FileMap)
         self.ToolsSplitter.addWidget(self.SymbolMenu)
+        # what each notebook's kernel is running, View > Kernels
+        self.KernelDock = QtWidgets.QDockWidget("Kernels")
+        self.KernelDock.setWidget(KernelMonitor(self.open_notebooks))
+        self.KernelDock.hide()
+        self.ToolsSplitter.addWidget(self.KernelDock)
+        self.menuView.addAction(self.KernelDock.toggleViewAction())
         # Add the splitter to the MainFrame's layout
         self.ToolsFrameLayout.addWidget(self.ToolsSplitter)
 
@@ -51,6 +75,39 @@ class Window(QMainWindow):
         self.actionTerminal.triggered.connect(self.new_terminal_tab)
 
         self.actionRun.triggered.connect(self.run_file)
+        self.actionRunStale.triggered.connect(self.run_stale_to_cell)
+        self.actionRestartRunAll.triggered.connect(self.restart_and_run_file)
+        self.actionParallelRun.triggered.connect(lambda: self.run_file(parallel=True))
+        self.actionInterrupt.triggered.connect(self.interrupt_kernel)
+        self.actionTimeLimit.triggered.connect(self.set_cell_time_limit)
+        self.actionOutputLimits.triggered.connect(self.set_output_limits)
+        self.actionPreloadModules.triggered.connect(self.set_preload_modules)
+        self.actionRerunFromCell.triggered.connect(self.rerun_from_cell)
+        self.actionShowCheckpoints.triggered.connect(self.show_checkpoints)
+        self.actionExportMetrics.triggered.connect(self.export_cell_metrics)
+        self.actionProfileCell.triggered.connect(self.profile_cell)
+        self.actionRecordTrace.toggled.connect(self.record_trace)
+        self.actionExportTrace.triggered.connect(self.export_trace)
+        # checkpoints are forked copies of the kernel, Linux only
+        self.actionKeepCheckpoints.setChecked(checkpoints.SUPPORTED)
+        self.actionKeepCheckpoints.setEnabled(checkpoints.SUPPORTED)
+
+        # streamed output is applied to the cells at most once per frame
+        self.output_timer = QtCore.QTimer(self)
+        self.output_timer.setSingleShot(True)
+        self.output_timer.setInterval(33)
+        self.output_timer.timeout.connect(self.flush_streamed_outputs)
+
+        # running a cell saves its notebook, batched and off the run path
+        self.pending_saves = set()  # notebook views to save when save_timer fires
+        self.save_timer = QtCore.QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(1500)
+        self.save_timer.timeout.connect(self.flush_pending_saves)
+
+        # a warm kernel waits for the first notebook to be opened
+        self.kernel_pool = KernelPool(self.preload_modules, parent=self)
+        self.kernel_pool.fill()
 
     def load_file_map(self):
         # Get the current working directory
@@ -175,8 +232,14 @@ class Window(QMainWindow):
             return
 
         file_name = os.path.basename(file_path)
+        if os.path.getsize(file_path) > LARGE_FILE:
+            # reading it into a text edit would take the memory of several copies and hang until done
+            if self.open_paged_view(file_path, f"{file_name} (read only)") is not None:
+                self.statusBar().showMessage(f"{file_name} is large, opened read only (Ctrl+G go to line, Ctrl+F find)", 5000)
+            return
+
         # tab_index = self.FileViewer.addTab(QtWidgets.QLabel(file_path), file_name)
-        editor = QtWidgets.QTextEdit()
+        editor = QtWidgets.QPlainTextEdit()
         editor.file_path = file_path
         editor.setTabStopDistance(4 * editor.fontMetrics().horizontalAdvance(" "))
         editor.document().setModified(False)
@@ -187,7 +250,7 @@ class Window(QMainWindow):
 
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                editor.setText(f.read())
+                editor.setPlainText(f.read())
                 editor.document().modificationChanged.connect(self.update_txt_tab_title)
         except Exception as e:
             print(f"Failed to open file: {e}")
@@ -199,143 +262,37 @@ class Window(QMainWindow):
         file_path = self.fileMapModel.filePath(file_index)
         file_name = os.path.basename(file_path)
 
-        # Create a scrollable container to hold multiple editors + labels
-        scroll = QtWidgets.QScrollArea()
-        scroll.setWidgetResizable(True)
-        scroll.file_path = file_path
-        scroll.console = code.InteractiveConsole(locals={})
-        scroll.preamble = ""
-        scroll.setFont(QtGui.QFont("Times New Roman", 14))
-
-        content = QtWidgets.QWidget()
-
-        content_layout = QtWidgets.QVBoxLayout(content)
-        content_layout.setContentsMargins(0, 0, 0, 0)
-        content_layout.setSpacing(0)
-
-
-        # identify the file preamble
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            notebook = Notebook.load(file_path, self.default_preamble)
         except Exception as e:
             self.statusBar().showMessage(f"Failed to open file: {e}", 3000)
             return
-
-        end_idx = None
-        usingDefault = False
-        # If the file isn't empty and the first line is the start-marker
-        if lines and lines[0].strip() == "#%%---%%":
-            # Start with the first line (include the opening marker)
-            preamble_lines = [lines[0]]
-            # Append subsequent lines until we hit the closing marker (inclusive)
-            for idx, line in enumerate(lines[1:]):
-                preamble_lines.append(line)
-                if line.strip() == "#%%---%%":
-                    end_idx = idx + 1
-                    break
-            else:
-                # Reached EOF without finding a closing marker
-                self.statusBar().showMessage("Error when opening: Unable to identify preamble, using default. Some features may not work as intended", 3000)
-                scroll.preamble = self.default_preamble
-                usingDefault = True
-
-            if not usingDefault:
-                # Join keeping original newlines/blank lines exactly as in the file
-                scroll.preamble = "".join(preamble_lines)
-        else:
-            # no preamble found, use default preamble (customize as needed)
-            scroll.preamble = self.default_preamble
-
-        # print(scroll.preamble)
-        if end_idx is not None:
-            del lines[:end_idx+1]
-
-        # Split into segments separated by lines that are exactly "#---"
-        segments = []
-        current_lines = []
-        for line in lines:
-            if line.strip() == "#---":
-                # Remove trailing newline from the last line if it exists
-                if current_lines and current_lines[-1].endswith('\n'):
-                    current_lines[-1] = current_lines[-1][:-1]
-                segments.append(''.join(current_lines))
-                current_lines = []
-            else:
-                current_lines.append(line)
-
-        # Append the last segment
-        segments.append(''.join(current_lines))
-
-        # Create a TextEdit followed by a QLabel("Temp") for each segment
-        for idx, seg_text in enumerate(segments):
-            editor = TextEdit()
-            editor.segment_index = idx  # Which segment this editor holds
-            editor.setPlainText(seg_text)
-            editor.setStyleSheet("background-color: #383838;")
-            editor.setFont(QtGui.QFont("Times New Roman", 14))
-            editor.document().setDefaultFont(QtGui.QFont("Times New Roman", 14))
-            editor.setTabStopDistance(4 * editor.fontMetrics().horizontalAdvance(" "))
-            editor.setSizePolicy(QtWidgets.QSizePolicy.Policy.Expanding, QtWidgets.QSizePolicy.Policy.Fixed)
-            editor.deleteRequested.connect(self.delete_cell)
-            editor.cellRunRequest.connect(self.cell_run_request)
-            editor.document().setModified(False)
-            # connect modification signal so existing update_tab logic still works
-            try:
-                editor.document().modificationChanged.connect(self.update_py_tab_title)
-                editor.document().documentLayout().documentSizeChanged.connect(self.recompute_editor_sizes)
-                # editor.document().contentsChanged
-            except Exception:
-                print("editor connections failed")
-
-            content_layout.addWidget(editor)
-
-            output = QtWidgets.QLabel("")
-            output.segment_index = idx
-            output.setFont(QtGui.QFont("Times New Roman", 14))
-            output.setAlignment(QtCore.Qt.AlignmentFlag.AlignLeft)
-            content_layout.addWidget(output)
-
-        newCell = QtWidgets.QPushButton("Click to insert a new cell")
-        newCell.setFont(QtGui.QFont("Times New Roman", 10))
-        newCell.setFixedHeight(35)
-        newCell.setSizePolicy(QtWidgets.QSizePolicy.Policy.Expanding, QtWidgets.QSizePolicy.Policy.Fixed)
-        newCell.clicked.connect(self.insert_new_cell)
-
-        content_layout.addWidget(newCell) # , alignment=QtCore.Qt.AlignmentFlag.AlignHCenter
-
-        effect = QtWidgets.QGraphicsOpacityEffect(newCell)
-        newCell.setGraphicsEffect(effect)
-        effect.setOpacity(0.0)
-
-        def _enter(e):
-            effect.setOpacity(1.0)
-
-        def _leave(e):
-            effect.setOpacity(0.0)
-
-        newCell.enterEvent = _enter
-        newCell.leaveEvent = _leave
-
-
-        # push content to top if there is extra space
-        content_layout.addStretch()
-
-        spacer_widget = QtWidgets.QWidget()
-        spacer_widget.setFixedHeight(800)
-        content_layout.addWidget(spacer_widget)
-
-        scroll.setWidget(content)
-
-        # add the scroll area as the tab content
-        tab_index = self.FileViewer.addTab(scroll, file_name)
+        for warning in notebook.warnings:
+            self.statusBar().showMessage(f"Error when opening: {warning}", 3000)
+
+        # the cells are painted, only the one being edited gets an editor
+        view = NotebookView(notebook)
+        view.file_path = file_path
+        view.kernel = KernelClient(pool=self.kernel_pool)
+        view.kernel.time_limit = self.cell_time_limit
+        view.kernel.died.connect(lambda exit_code, s=view: self.on_kernel_died(s, exit_code))
+        # stop the kernel process together with the tab
+        view.destroyed.connect(lambda _=None, k=view.kernel: k.shutdown())
+        view.run_tracker = RunTracker()
+        view.checkpoints = {}  # kernel checkpoint id -> (cell it was taken after, run tracker seq)
+        view.cellRunRequest.connect(self.cell_run_request)
+        view.deleteRequested.connect(self.delete_cell)
+        view.cellEdited.connect(lambda _, s=view: self.update_py_tab_title(s))
+        view.outputLinkActivated.connect(lambda cell, s=view: self.open_full_output(s, cell))
+        view.insertRequested.connect(lambda s=view: self.insert_new_cell(s))
+
+        # add the view as the tab content
+        tab_index = self.FileViewer.addTab(view, file_name)
         self.FileViewer.setCurrentIndex(tab_index)
 
-        self.recompute_editor_sizes()
-
         QApplication.processEvents()
 
-        self.run_cell(scroll, [-1])
+        self.run_cell(view, [-1])
 
     def new_terminal_tab(self):
         """
@@ -367,106 +324,39 @@ class Window(QMainWindow):
         term.input.setFocus()
 
     def delete_cell(self, widget):
-        if self.busy_flag[0] or (len(self.worker_queue)>0):
-            self.statusBar().showMessage("Could not delete cell: Unable to delete while running", 3000)
+        target_view = getattr(widget, "view", None)
+        if target_view is None:
+            self.statusBar().showMessage("Could not delete cell: Unable to locate target notebook", 3000)
             return
 
-        index_to_delete = widget.segment_index
-
-        # find the scroll area that contains the widget
-        target_scroll = None
-        container = None
-        for i in range(self.FileViewer.count()):
-            w = self.FileViewer.widget(i)
-            if isinstance(w, QtWidgets.QScrollArea):
-                cont = w.widget()
-                for ed in cont.findChildren(TextEdit):
-                    if ed is widget:
-                        target_scroll = w
-                        container = cont
-                        break
-                if target_scroll:
-                    break
-
-        if target_scroll is None or container is None:
-            self.statusBar().showMessage("Could not delete cell: Unable to locate target scroll", 3000)
-            return
-
-        layout = container.layout()
-        if layout is None:
-            self.statusBar().showMessage("Could not delete cell: container has no layout", 3000)
-            return
-
-        # Build list of widgets in visual/layout order
-        widgets_in_order = []
-        for i in range(layout.count()):
-            item = layout.itemAt(i)
-            if item is None:
-                continue
-            w = item.widget()
-            if w is not None:
-                widgets_in_order.append((i, w))
+        if target_view.kernel.is_busy():
+            self.statusBar().showMessage("Could not delete cell: Unable to delete while running", 3000)
+            return
 
-        # Count how many TextEdit editors exist
-        editors = [w for _, w in widgets_in_order if isinstance(w, TextEdit)]
-        if len(editors) <= 1:
+        notebook = target_view.notebook
+        if len(notebook) <= 1:
             self.statusBar().showMessage("Could not delete cell: Can not delete last cell", 3000)
             return
 
-        # Find the layout index of the TextEdit to delete
-        target_layout_index = None
-        for layout_index, w in widgets_in_order:
-            if isinstance(w, TextEdit) and getattr(w, "segment_index", None) == index_to_delete:
-                target_layout_index = layout_index
-                break
+        cell = widget.cell
+        index_to_delete = notebook.index(cell)
+        self.output_spool.discard(target_view.cell_model.spool_paths.pop(cell.id, None))
+        self.streamed_outputs.pop(cell, None)
+        # takes the editor with it
+        target_view.remove_cell(cell)
 
-        # If we couldn't find by segment_index, try identity comparison
-        if target_layout_index is None:
-            for layout_index, w in widgets_in_order:
-                if w is widget:
-                    target_layout_index = layout_index
-                    break
-
-        if target_layout_index is None:
-            self.statusBar().showMessage("Could not delete cell: widget not found in layout", 3000)
-            return
-
-        # Now remove all widgets that belong to that cell.
-        # Assumption: widgets for a cell appear *after* the TextEdit in layout until next TextEdit.
-        # We remove widgets starting from target_layout_index until we hit the next TextEdit (or end).
-        kill_list = []
-        found = False
-        for idx, w in widgets_in_order:
-            if hasattr(w, "segment_index"):
-                if w.segment_index == index_to_delete:
-                    kill_list.append(idx)
-
-        # Delete in reverse order (so layout indices remain valid while taking)
-        for li in sorted(kill_list, reverse=True):
-            item = layout.takeAt(li)
-            if item:
-                w = item.widget()
-                if w:
-                    w.setParent(None)
-                    w.deleteLater()
-
-        # Rebuild indexes using layout order
-        self.update_segment_indecies_from_layout(container)
-        # mark modified
-        editors_remaining = container.findChildren(TextEdit)
-        if editors_remaining:
-            editors_remaining[0].document().setModified(True)
+        target_view.run_tracker.forget(cell)
+        for checkpoint_id, (key, _) in list(target_view.checkpoints.items()):
+            if key is cell:
+                del target_view.checkpoints[checkpoint_id]
+                target_view.kernel.drop_checkpoint(checkpoint_id)
 
+        # mark modified
+        self.update_py_tab_title(target_view)
 
         # move the cursor to prev cell
-        prev_edit = None
-        for ed in editors:
-            if ed.segment_index == index_to_delete - 1:
-                prev_edit = ed
-                break
-
-        if prev_edit is not None:
-            prev_edit.setFocus()  # give focus
+        if index_to_delete > 0:
+            prev_edit = target_view.edit_cell(notebook[index_to_delete - 1])
             cursor = prev_edit.textCursor()
             cursor.movePosition(QtGui.QTextCursor.MoveOperation.Start)  # move to start of document
             prev_edit.setTextCursor(cursor)
@@ -474,256 +364,410 @@ class Window(QMainWindow):
         QApplication.processEvents()
 
     def cell_run_request(self, widget):
-        # find the scroll area that contains the widget
-        target_scroll = None
-        container = None
-        for i in range(self.FileViewer.count()):
-            w = self.FileViewer.widget(i)
-            if isinstance(w, QtWidgets.QScrollArea):
-                cont = w.widget()
-                for ed in cont.findChildren(TextEdit):
-                    if ed is widget:
-                        target_scroll = w
-                        container = cont
-                        break
-                if target_scroll:
-                    break
-
-        if target_scroll is None or container is None:
-            self.statusBar().showMessage("Could not run cell: Unable to locate target scroll", 3000)
-            return
-
-        target_cell = widget.segment_index
-
-        next_edit = None
-        for ed in container.findChildren(TextEdit):
-            if ed.segment_index == target_cell+1:
-                next_edit = ed
-                break
+        target_view = getattr(widget, "view", None)
+        if target_view is None:
+            self.statusBar().showMessage("Could not run cell: Unable to locate target notebook", 3000)
+            return
 
-        if next_edit is None:
-            self.insert_new_cell()
-            for ed in container.findChildren(TextEdit):
-                if ed.segment_index == target_cell + 1:
-                    next_edit = ed
-                    break
+        notebook = target_view.notebook
+        target_cell = notebook.index(widget.cell)
 
-        if next_edit is not None:
-            next_edit.setFocus()  # give focus
-            cursor = next_edit.textCursor()
-            cursor.movePosition(QtGui.QTextCursor.MoveOperation.Start)  # move to start of document
-            next_edit.setTextCursor(cursor)
+        if target_cell + 1 == len(notebook):
+            self.insert_new_cell(target_view)
 
-        self.run_cell(target_scroll, [target_cell])
+        next_edit = target_view.edit_cell(notebook[target_cell + 1])
+        cursor = next_edit.textCursor()
+        cursor.movePosition(QtGui.QTextCursor.MoveOperation.Start)  # move to start of document
+        next_edit.setTextCursor(cursor)
 
-    def update_segment_indecies_from_layout(self, container):
+        with pipelineTrace.span("run_cell", cell=target_cell + 1):
+            self.run_cell(target_view, [target_cell])
+
+
+
+    def run_file(self, parallel=False):
         """
-        Re-assign segment_index according to visual/layout order.
-        This walks the container layout and increments editor index when a TextEdit is encountered.
+        Run a python file. Put output under the cells. Only cells that are out of date are run again.
+        With parallel, cells that do not depend on each other run at the same time.
         """
-        layout = container.layout()
-        if layout is None:
+        target_view = self.FileViewer.currentWidget()
+        if not isinstance(target_view, NotebookView):
+            self.statusBar().showMessage("Nothing to run", 3000)
             return
 
-        current_index = -1
-        for i in range(layout.count()):
-            item = layout.itemAt(i)
-            if item is None:
-                continue
-            w = item.widget()
-            if w is None:
-                continue
-
-            if isinstance(w, TextEdit):
-                current_index += 1
-                w.segment_index = current_index
-            elif hasattr(w, "segment_index"):
-                # assign to the last seen editor index
-                w.segment_index = current_index
+        stale = self.stale_cells(target_view)
+        if not stale:
+            self.statusBar().showMessage("Nothing to run: every cell is up to date", 3000)
+            return
 
+        self.run_cell(target_view, stale, parallel)
         QApplication.processEvents()
 
-    def run_file(self):
-        """Run a python file. Put output into labels."""
-        sender_doc = self.sender()
-        target_scroll = None
-        target_index = None
-
-        # find the scroll area that contains the editor whose document is sender_doc
-        for i in range(self.FileViewer.count()):
-            w = self.FileViewer.widget(i)
-            if isinstance(w, QtWidgets.QScrollArea):
-                container = w.widget()
-                for ed in container.findChildren(TextEdit):
-                    if ed.document() is sender_doc:
-                        target_scroll = w
-                        target_index = i
-                        break
-                if target_scroll:
-                    break
-
-        # fallback to focused scroll area
-        if target_scroll is None:
-            widget = self.FileViewer.currentWidget()
-            if not isinstance(widget, QtWidgets.QScrollArea):
-                self.statusBar().showMessage("Nothing to run", 3000)
-                return
-            target_scroll = widget
-            target_index = self.FileViewer.currentIndex()
-
-
-        # self.save_file(target_index)
+    def restart_and_run_file(self):
+        """Throw away the notebook namespace and run the preamble and every cell from scratch."""
+        target_view = self.FileViewer.currentWidget()
+        if not isinstance(target_view, NotebookView):
+            self.statusBar().showMessage("Nothing to run", 3000)
+            return
+        self.restart_and_run(target_view)
 
-        target_scroll.console = code.InteractiveConsole(locals={})
+    def restart_and_run(self, target_view):
+        target_view.kernel.reset()
+        target_view.run_tracker.clear()
+        target_view.checkpoints.clear()
 
-        cells = target_scroll.findChildren(TextEdit)
-        # outputs = target_scroll.findChildren(QtWidgets.QLabel)
+        self.run_cell(target_view, [-1] + list(range(len(target_view.notebook))))
+        QApplication.processEvents()
 
-        idx = list(range(len(cells)))
-        idx.insert(0,-1)
+    def run_stale_to_cell(self):
+        """Run the focused cell and whatever out of date cells it depends on."""
+        editor = QApplication.focusWidget()
+        if not isinstance(editor, TextEdit):
+            self.statusBar().showMessage("Select a cell to run", 3000)
+            return
 
-        self.run_cell(target_scroll, idx)
-        QApplication.processEvents()
+        target_view = editor.view
+        stale = self.stale_cells(target_view, target_view.notebook.index(editor.cell))
+        if not stale:
+            self.statusBar().showMessage("Nothing to run: the cell is up to date", 3000)
+            return
 
-    def run_cell(self, target_scroll, target_cells: list):
-        self.save_file()
+        self.run_cell(target_view, stale)
 
-        # cells = target_scroll.findChildren(TextEdit)
-        # find the correct output label
-        outputs = target_scroll.findChildren(QtWidgets.QLabel)
+    def profile_cell(self):
+        """Run the focused cell under the profiler and show where its time went in a new tab."""
+        editor = QApplication.focusWidget()
+        if not isinstance(editor, TextEdit):
+            self.statusBar().showMessage("Select a cell to profile", 3000)
+            return
 
-        for target_cell in target_cells:
-            QApplication.processEvents()
-            output = None
-            for i in range(len(outputs)):
-                if outputs[i].segment_index == target_cell:
-                    output = outputs[i]
+        target_view = editor.view
+        profile = {"sampling": self.actionProfileSampling.isChecked()}
+        self.run_cell(target_view, [target_view.notebook.index(editor.cell)], profile=profile)
 
+    def show_profile(self, profile, title, default_path):
+        view = ProfileView(profile, default_path)
+        tab_index = self.FileViewer.addTab(view, title)
+        self.FileViewer.setCurrentIndex(tab_index)
 
-            # get the code from the file
-            file_path = target_scroll.file_path
+    def rerun_from_cell(self):
+        """Go back to the newest checkpoint before the focused cell and run everything from there on."""
+        editor = QApplication.focusWidget()
+        if not isinstance(editor, TextEdit):
+            self.statusBar().showMessage("Select a cell to rerun from", 3000)
+            return
 
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-            except Exception as e:
-                self.statusBar().showMessage(f"Error with Run, Failed to open file: {e}", 3000)
+        self.rerun_before(editor.view, editor.view.notebook.index(editor.cell))
+
+    def rerun_before(self, target_view, first_cell):
+        """Rerun every cell from first_cell on, starting from the newest checkpoint taken before it."""
+        notebook = target_view.notebook
+        usable = {}  # cell index -> checkpoint id
+        for checkpoint_id, (key, _) in target_view.checkpoints.items():
+            index = -1 if key == "preamble" else notebook.index(key)
+            if index < first_cell:
+                usable[index] = checkpoint_id
+        if not usable:
+            self.statusBar().showMessage("No checkpoint before this cell, running everything", 3000)
+            self.restart_and_run(target_view)
+            return
+        self.rerun_from_checkpoint(target_view, usable[max(usable)], first_cell)
+
+    def rerun_from_checkpoint(self, target_view, checkpoint_id, first_cell=None):
+        """Restore a checkpoint of the notebook's kernel and run the cells after the one it was taken after."""
+        key, seq = target_view.checkpoints[checkpoint_id]
+        if first_cell is None:
+            first_cell = 0 if key == "preamble" else target_view.notebook.index(key) + 1
+
+        def on_restored(reply, view=target_view):
+            if not reply["ok"]:
+                # evicted by the kernel in the meantime, try an older one
+                view.checkpoints.pop(checkpoint_id, None)
+                self.rerun_before(view, first_cell)
                 return
+            # the namespace is back to how it was when the checkpoint was taken
+            view.run_tracker.rewind(seq)
+            for newer_id, (_, newer_seq) in list(view.checkpoints.items()):
+                if newer_seq > seq:
+                    del view.checkpoints[newer_id]
+
+            # cells may have moved while the kernel restored
+            after = -1 if key == "preamble" else view.notebook.index(key)
+            self.run_cell(view, list(range(after + 1, len(view.notebook))))
+
+        self.statusBar().showMessage("Restoring checkpoint", 3000)
+        target_view.kernel.restore(checkpoint_id, on_restored)
+
+    def show_checkpoints(self):
+        target_view = self.FileViewer.currentWidget()
+        if not isinstance(target_view, NotebookView):
+            self.statusBar().showMessage("Open a notebook to see its checkpoints", 3000)
+            return
 
-            if target_cell == -1:
-                cell_code = target_scroll.preamble
-            else:
-                cell_code = ""
-                count = 0
-                for line in lines[len(target_scroll.preamble.splitlines()):]:
-                    if line.strip() == "#---":
-                        count += 1
+        def rerun(checkpoint_id, view=target_view):
+            if checkpoint_id in view.checkpoints:
+                self.rerun_from_checkpoint(view, checkpoint_id)
 
-                    if (count == target_cell) and not (line.strip() == "#---"):
-                        cell_code = "".join([cell_code, line])
+        dialog = CheckpointsDialog(target_view.kernel, rerun, self)
+        dialog.setAttribute(QtCore.Qt.WidgetAttribute.WA_DeleteOnClose)
+        dialog.show()
 
-            self.worker_counter += 1
-            worker_id = self.worker_counter
+    def stale_cells(self, target_view, target_cell=None):
+        """Indexes of the cells (-1 for the preamble) that need to run again, see cellDeps."""
+        notebook = target_view.notebook
+        cells = [("preamble", notebook.preamble)] + [(cell, cell.source) for cell in notebook]
+        target = None if target_cell is None else target_cell + 1
+        return [pos - 1 for pos in target_view.run_tracker.stale(cells, target)]
 
-            worker = CodeCapture(target_scroll.console, cell_code, self.worker_queue, self.busy_flag, wid=worker_id)
+    def run_cell(self, target_view, target_cells: list, parallel=False, profile=None):
+        # cells run from the editors as they are, the file catches up a moment later
+        self.schedule_save(target_view)
+        batch = []  # cells for a parallel run, sent together once they are all collected
 
-            # cleanup handling
-            worker.finished.connect(lambda wid=worker_id: self.cleanup_worker(wid))
+        notebook = target_view.notebook
+        file_name = os.path.basename(target_view.file_path)
+        code_dir = code_cache_dir_for(target_view.file_path)
 
-            if output is not None:
+        for target_cell in target_cells:
+            # the run tracker compares against the source that ran
+            if target_cell == -1:
+                key, cell_code = "preamble", notebook.preamble
+            else:
+                key = notebook[target_cell]
+                cell_code = key.source
+                key.state = "queued"
+            source = cell_code
+
+            def on_done(reply, view=target_view, KEY=key, SOURCE=source):
+                view.run_tracker.record(KEY, SOURCE, reply["status"] == "ok")
+                metrics = dict(reply.get("metrics") or {}, cached=reply.get("cached", False))
+                if KEY == "preamble":
+                    view.notebook.preamble_metrics = metrics
+                else:
+                    KEY.state = reply["status"]
+                    KEY.output = reply["output"]
+                    KEY.metrics = metrics
+                    self.finish_output(reply["output"], view, KEY)
+                if reply.get("checkpoint"):
+                    view.checkpoints[reply["checkpoint"]] = (KEY, view.run_tracker.seq)
+                if reply.get("profile"):
+                    name = reply["profile"]["filename"].strip("<>")
+                    default_path = os.path.join(os.path.dirname(view.file_path), name.replace(" ", "_") + ".pstats")
+                    self.show_profile(reply["profile"], f"Profile: {name}", default_path)
+
+            options = {
+                "filename": f"<{file_name} preamble>" if target_cell == -1 else f"<{file_name} cell {target_cell + 1}>",
+                "code_dir": code_dir,
+            }
+            # the preamble is cheap and sets up the symbols, never cache it
+            if self.actionCacheResults.isChecked() and target_cell != -1 and profile is None:
+                options["cache_dir"] = cache_dir_for(target_view.file_path)
+            # the kernel only keeps one if the cell was slow, see checkpoints.py
+            if self.actionKeepCheckpoints.isChecked() and not parallel:
+                options["checkpoint"] = True
+            if profile is not None:
+                options["profile"] = profile
+            if self.output_limits != DEFAULT_OUTPUT_LIMITS:
+                options["output_limits"] = self.output_limits
+
+            if target_cell != -1:
+                self.show_output(target_view, key, ". . .")
+
+            if parallel:
+                batch.append((cell_code, on_done, options))
+            elif target_cell != -1:
                 # output handling
-                worker.output.connect(lambda out_str, OUT=output: self.set_output_label(out_str, OUT))
-
-            self.workers[worker_id] = worker
-            worker.start()
-
-    def set_output_label(self, out_str, out_label):
-        out_str = out_str.removesuffix("\n")
-        out_label.setText(out_str)
-
-    def cleanup_worker(self, worker_id):
-        if not (len(self.worker_queue)==0):
-            self.worker_queue.pop(0)
-
-        self.busy_flag[0] = False
+                target_view.kernel.execute(cell_code, on_done=on_done,
+                                           on_stream=lambda text, s=target_view, c=key: self.stream_output(text, s, c),
+                                           **options)
+            else:
+                target_view.kernel.execute(cell_code, on_done=on_done, **options)
 
-        worker = self.workers.pop(worker_id)
-        if worker:
-            worker.deleteLater()
-            print(f"Worker {worker_id} finished and deleted.")
+        if batch:
+            target_view.kernel.execute_parallel(batch)
 
-    def recompute_editor_sizes(self):
-        """Recompute each editor's height to fit contents."""
-        scroll = self.FileViewer.currentWidget()
-        if not scroll:
+    def open_notebooks(self):
+        """(tab title, KernelClient) of every open notebook, in tab order."""
+        for i in range(self.FileViewer.count()):
+            w = self.FileViewer.widget(i)
+            if isinstance(w, NotebookView):
+                yield self.FileViewer.tabText(i), w.kernel
+
+    def interrupt_kernel(self):
+        """Stop the running cell of the current notebook and cancel its queued cells."""
+        target_view = self.FileViewer.currentWidget()
+        if not isinstance(target_view, NotebookView):
+            self.statusBar().showMessage("Nothing to interrupt", 3000)
             return
+        if not target_view.kernel.is_busy():
+            self.statusBar().showMessage("Nothing is running", 3000)
+            return
+        target_view.kernel.interrupt()
 
-        widget = scroll.widget()
-        editors = widget.findChildren(TextEdit)
-
-        for ed in editors:
-            ed.viewport().update()  # ensure viewport geometry is current
-            doc = ed.document()
+    def set_cell_time_limit(self):
+        current = self.cell_time_limit or 0
+        seconds, ok = QtWidgets.QInputDialog.getDouble(self, "Cell Time Limit", "Seconds a cell may run (0 for no limit):", current, 0, 86400, 1)
+        if not ok:
+            return
 
-            # document().size().height() returns the laid-out height in pixels; add frame & margins
-            doc_height = int(doc.size().height())
-            doc_margin = int(doc.documentMargin())
+        self.cell_time_limit = seconds or None
+        for i in range(self.FileViewer.count()):
+            w = self.FileViewer.widget(i)
+            if isinstance(w, NotebookView):
+                w.kernel.time_limit = self.cell_time_limit
+
+    def set_output_limits(self):
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle("Output Limits")
+        form = QtWidgets.QFormLayout(dialog)
+        fields = {}
+        for key, label in (("chars_per_second", "Characters a second:"), ("writes_per_second", "Writes a second:"),
+                           ("max_chars", "Characters per cell:")):
+            spin = QtWidgets.QSpinBox()
+            spin.setRange(1, 2_000_000_000)
+            spin.setGroupSeparatorShown(True)
+            spin.setValue(self.output_limits[key])
+            form.addRow(label, spin)
+            fields[key] = spin
+        form.addRow(QtWidgets.QLabel("Output over the limits is dropped, a note says how much."))
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.StandardButton.Ok | QtWidgets.QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        form.addRow(buttons)
+        if dialog.exec() != QtWidgets.QDialog.DialogCode.Accepted:
+            return
 
-            new_height = max(20, doc_height + doc_margin)
-            ed.setFixedHeight(new_height)
+        self.output_limits = {key: spin.value() for key, spin in fields.items()}
 
-    def insert_new_cell(self):
-        scroll = self.FileViewer.currentWidget()
-        if not scroll:
-            self.statusBar().showMessage(f"Failed to insert cell", 3000)
+    def set_preload_modules(self):
+        text, ok = QtWidgets.QInputDialog.getText(self, "Preload Modules", "Modules spare kernels import ahead of time, comma separated\n"
+                                                  "(e.g. sympy, numpy, scipy, astropy):", text=", ".join(self.preload_modules))
+        if not ok:
             return
 
-        widget = scroll.widget()
-        content_layout = widget.layout()
-        idx = len(widget.findChildren(TextEdit))
+        self.preload_modules = [name.strip() for name in text.split(",") if name.strip()]
+        self.kernel_pool.set_preload(self.preload_modules)
+
+    def on_kernel_died(self, view, exit_code):
+        self.statusBar().showMessage(f"Kernel for {os.path.basename(view.file_path)} died (exit code {exit_code}), restarting", 5000)
+        # a fresh kernel needs the preamble before any cell can run
+        view.run_tracker.clear()
+        view.checkpoints.clear()
+        self.run_cell(view, [-1])
+
+    def export_cell_metrics(self):
+        """Write what each cell of the current notebook cost on its last run to a JSON file."""
+        target_view = self.FileViewer.currentWidget()
+        if not isinstance(target_view, NotebookView):
+            self.statusBar().showMessage("Open a notebook to export its metrics", 3000)
+            return
 
-        editor = TextEdit()
-        editor.segment_index = idx  # Which segment this editor holds
-        editor.setPlainText("")
-        editor.setStyleSheet("background-color: #383838;")
-        editor.setFont(QtGui.QFont("Times New Roman", 14))
-        editor.document().setDefaultFont(QtGui.QFont("Times New Roman", 14))
-        editor.setTabStopDistance(4*editor.fontMetrics().horizontalAdvance(" "))
-        editor.setSizePolicy(QtWidgets.QSizePolicy.Policy.Expanding, QtWidgets.QSizePolicy.Policy.Fixed)
-        editor.deleteRequested.connect(self.delete_cell)
-        editor.cellRunRequest.connect(self.cell_run_request)
-        editor.document().setModified(True)
+        notebook = target_view.notebook
+        default_path = os.path.splitext(notebook.path)[0] + ".metrics.json"
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export Cell Metrics", default_path, "JSON (*.json)")
+        if not path:
+            return
 
-        # connect modification signal so existing update_tab logic still works
+        data = {
+            "notebook": notebook.path,
+            "exported": time.time(),
+            "preamble": notebook.preamble_metrics,
+            "cells": [dict(cell.metrics, index=i, id=cell.id, state=cell.state) for i, cell in enumerate(notebook)],
+        }
         try:
-            editor.document().modificationChanged.connect(self.update_py_tab_title)
-            editor.document().documentLayout().documentSizeChanged.connect(self.recompute_editor_sizes)
-            # editor.document().contentsChanged
-        except Exception:
-            print("editor connections failed")
-
-        content_layout.insertWidget(content_layout.count() - 3, editor)
-
-        output = QtWidgets.QLabel("")
-        output.segment_index = idx
-        output.setFont(QtGui.QFont("Times New Roman", 14))
-        output.setAlignment(QtCore.Qt.AlignmentFlag.AlignLeft)
-        content_layout.insertWidget(content_layout.count() - 3, output)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1)
+        except Exception as e:
+            QtWidgets.QMessageBox.critical(self, "Export Error", f"Could not export metrics:\n{e}")
+            return
+        self.statusBar().showMessage(f"Metrics written to {os.path.basename(path)}", 3000)
+
+    def record_trace(self, checked):
+        """Start or stop recording pipeline spans, see pipelineTrace."""
+        if checked:
+            pipelineTrace.start()
+            pipelineTrace.name_process("Pydonia GUI")
+            self.statusBar().showMessage("Recording pipeline trace", 3000)
+        else:
+            pipelineTrace.stop()
 
-        self.update_py_tab_title()
+    def export_trace(self):
+        if not pipelineTrace.events:
+            self.statusBar().showMessage("Nothing recorded: turn on Record Pipeline Trace first", 3000)
+            return
 
-        # force immediate layout pass
-        widget.adjustSize()
-        widget.updateGeometry()
-        content_layout.update()
-        QtWidgets.QApplication.processEvents()  # synchronous — lets Qt finish layout changes
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export Trace", "pydonia.trace.json", "Chrome trace (*.json)")
+        if not path:
+            return
+        try:
+            pipelineTrace.export(path)
+        except Exception as e:
+            QtWidgets.QMessageBox.critical(self, "Export Error", f"Could not export trace:\n{e}")
+            return
+        self.statusBar().showMessage(f"Trace written to {os.path.basename(path)}, open it in Perfetto", 3000)
+
+    def stream_output(self, text, view, cell):
+        """Collect output of a running cell, the view is updated by flush_streamed_outputs."""
+        self.streamed_outputs[cell] = self.streamed_outputs.get(cell, "") + text
+        self.dirty_outputs.add((view, cell))
+        if not self.output_timer.isActive():
+            self.output_timer.start()
+
+    def flush_streamed_outputs(self):
+        dirty, self.dirty_outputs = self.dirty_outputs, set()
+        with pipelineTrace.span("flush_streamed_outputs", cells=len(dirty)):
+            for view, cell in dirty:
+                try:
+                    self.show_output(view, cell, self.streamed_outputs[cell])
+                except RuntimeError:
+                    # view went away with its tab
+                    self.streamed_outputs.pop(cell, None)
+
+    def finish_output(self, out_str, view, cell):
+        self.streamed_outputs.pop(cell, None)
+        self.dirty_outputs.discard((view, cell))
+        # the last long output is kept on disk until it is replaced
+        spool_paths = view.cell_model.spool_paths
+        self.output_spool.discard(spool_paths.pop(cell.id, None))
+        if outputSpool.too_long(out_str):
+            spool_paths[cell.id] = self.output_spool.write(out_str)
+        self.show_output(view, cell, None)
+
+    def show_output(self, view, cell, out_str):
+        """Show out_str as the cell's output, None for the output it was left with."""
+        with pipelineTrace.span("show_output", chars=len(out_str or "")):
+            view.cell_model.show_output(cell, out_str)
+
+    def open_full_output(self, view, cell):
+        """Show a spooled output in a paged viewer tab."""
+        path = view.cell_model.spool_paths.get(cell.id)
+        if not path:
+            return
+        title = f"Output: {os.path.basename(view.file_path)} cell {view.notebook.index(cell) + 1}"
+        self.open_paged_view(path, title)
 
-        # QtCore.QTimer.singleShot(0, self.recompute_editor_sizes)
+    def open_paged_view(self, path, title):
+        """Show a file too big for a text edit in a PagedTextView tab. Returns the view, None if the file could not be opened."""
+        try:
+            paged_view = PagedTextView(path)
+        except OSError as e:
+            self.statusBar().showMessage(f"Could not open {os.path.basename(path)}: {e}", 3000)
+            return None
+        paged_view.message.connect(lambda text: self.statusBar().showMessage(text, 3000))
+        tab_index = self.FileViewer.addTab(paged_view, title)
+        self.FileViewer.setCurrentIndex(tab_index)
+        return paged_view
 
-        self.recompute_editor_sizes()
+    def insert_new_cell(self, view=None):
+        if view is None:
+            view = self.FileViewer.currentWidget()
+        if not isinstance(view, NotebookView):
+            self.statusBar().showMessage(f"Failed to insert cell", 3000)
+            return
 
-        # scrollbar = scroll.verticalScrollBar()
-        # QtCore.QTimer.singleShot(0, lambda: scrollbar.setValue(scrollbar.maximum()))
+        cell = view.append_cell()
+        self.update_py_tab_title(view)
+        view.edit_cell(cell)
 
     def save_file(self, index=None):
         """ Save the tab. If tabs and index are provided, save that tab, otherwise save current tab. """
@@ -745,30 +789,47 @@ class Window(QMainWindow):
             return False
 
         # Plain text editor case
-        if isinstance(widget, QtWidgets.QTextEdit):
-            saved = self._save_to_path(widget.toPlainText(), path)
+        if isinstance(widget, QtWidgets.QPlainTextEdit):
+            def write():
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(widget.toPlainText())
+
+            saved = self._save_to_path(path, write)
             if saved:
                 widget.document().setModified(False)
             return saved
 
-        # Scroll area (py file with segments) — write entire content in one go
-        elif isinstance(widget, QtWidgets.QScrollArea):
-            editors = widget.findChildren(TextEdit)
-            # join with separator exactly like your loader expects
-            full_text = widget.preamble
-            usr_code = "\n#---\n".join(ed.toPlainText() for ed in editors)
-            full_text = "".join([full_text, usr_code])
-
-            saved = self._save_to_path(full_text, path)
+        # Notebook (py file with segments) — write entire content in one go
+        elif isinstance(widget, NotebookView):
+            saved = self._save_to_path(path, lambda: widget.notebook.save(path))
             if saved:
-                for ed in editors:
-                    ed.document().setModified(False)
+                self.update_py_tab_title(widget)
             return saved
 
         else:
             self.statusBar().showMessage("Nothing to save", 3000)
             return False
 
+    def schedule_save(self, view):
+        """Save the notebook once nothing asked for a save for a moment."""
+        self.pending_saves.add(view)
+        self.save_timer.start()
+
+    def flush_pending_saves(self, only=None):
+        """Save the notebooks waiting on save_timer (only that one if given) that have unsaved changes."""
+        self.save_timer.stop()
+        pending = [only] if only is not None else list(self.pending_saves)
+        for view in pending:
+            self.pending_saves.discard(view)
+            index = self.FileViewer.indexOf(view)
+            if index == -1:
+                # closed in the meantime
+                continue
+            if view.notebook.dirty:
+                self.save_file(index)
+        if self.pending_saves:
+            self.save_timer.start()
+
     def _append_to_path(self, text, path):
         """append the text to the bottom of path"""
         try:
@@ -780,49 +841,31 @@ class Window(QMainWindow):
         # mark document as saved
         return True
 
-    def _save_to_path(self, text, path):
-        """Write the text to path"""
+    def _save_to_path(self, path, save):
+        """Call save() to write path, telling the user if it failed. Returns whether it worked."""
         try:
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(text)
+            with pipelineTrace.span("save_file", file=os.path.basename(path)):
+                save()
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, "Save Error", f"Could not save file:\n{e}")
             return False
         # mark document as saved
         return True
 
-    def update_py_tab_title(self):
-        """Set tab title for a scroll-area-backed python file when any segment changes."""
-        sender_doc = self.sender()
-        target_scroll = None
-        target_index = None
-
-        # find the scroll area that contains the editor whose document is sender_doc
-        for i in range(self.FileViewer.count()):
-            w = self.FileViewer.widget(i)
-            if isinstance(w, QtWidgets.QScrollArea):
-                container = w.widget()
-                for ed in container.findChildren(TextEdit):
-                    if ed.document() is sender_doc:
-                        target_scroll = w
-                        target_index = i
-                        break
-                if target_scroll:
-                    break
-
-        # fallback to focused scroll area
-        if target_scroll is None:
-            widget = self.FileViewer.currentWidget()
-            if not isinstance(widget, QtWidgets.QScrollArea):
+    def update_py_tab_title(self, target_view=None):
+        """Set tab title for a notebook-backed python file when any segment changes."""
+        # fallback to focused notebook
+        if target_view is None:
+            target_view = self.FileViewer.currentWidget()
+            if not isinstance(target_view, NotebookView):
                 return
-            target_scroll = widget
-            target_index = self.FileViewer.currentIndex()
 
-        # determine modified status across all editors in this scroll
-        container = target_scroll.widget()
-        mod = any(ed.document().isModified() for ed in container.findChildren(TextEdit))
-        file_name = os.path.basename(target_scroll.file_path)
-        star = "*" if mod else ""
+        target_index = self.FileViewer.indexOf(target_view)
+        if target_index == -1:
+            return
+
+        file_name = os.path.basename(target_view.file_path)
+        star = "*" if target_view.notebook.dirty else ""
         self.FileViewer.setTabText(target_index, f"{star}{file_name}")
 
     def update_txt_tab_title(self, modified=None):
@@ -834,7 +877,7 @@ class Window(QMainWindow):
         # find editor whose document() is sender_doc
         for i in range(self.FileViewer.count()):
             w = self.FileViewer.widget(i)
-            if isinstance(w, QtWidgets.QTextEdit) and w.document() is sender_doc:
+            if isinstance(w, QtWidgets.QPlainTextEdit) and w.document() is sender_doc:
                 target_index = i
                 target_editor = w
                 break
@@ -843,7 +886,7 @@ class Window(QMainWindow):
         if target_editor is None:
             target_index = self.FileViewer.currentIndex()
             target_editor = self.FileViewer.currentWidget()
-            if not isinstance(target_editor, QtWidgets.QTextEdit):
+            if not isinstance(target_editor, QtWidgets.QPlainTextEdit):
                 return
 
         file_name = os.path.basename(target_editor.file_path)
@@ -858,6 +901,9 @@ class Window(QMainWindow):
             return
 
         try:
+            if widget in self.pending_saves:
+                # it was about to be saved anyway
+                self.flush_pending_saves(widget)
             title = tabs.tabText(index) or ""
             if title.startswith('*'):
                 # Ask the user
@@ -897,6 +943,7 @@ class Window(QMainWindow):
         Called when the window is closing. Iterate through tabs and, for any
         whose tab text begins with '*', ask the user whether to save.
         """
+        self.flush_pending_saves()
 
         for i in range(self.FileViewer.count() - 1, -1, -1):
             title = self.FileViewer.tabText(i)
@@ -933,6 +980,8 @@ class Window(QMainWindow):
                     return
 
         # If we get here, user didn't cancel — accept the close
+        self.kernel_pool.shutdown()
+        self.output_spool.close()
         event.accept()
         super().closeEvent(event)
 
@@ -0,0 +1,173 @@
+# notebookModel.py
+"""
+The document behind a notebook tab, without any widgets.
+
+A notebook file starts with a preamble between two "#%%---%%" lines, followed by
+the cells separated by "#---" lines. Notebook.parse and Notebook.text convert
+between the two; the GUI and the headless runner both go through them.
+
+Cells keep their id while cells around them are inserted or deleted. Finding a
+cell by id or by position, and the position of a cell, take constant time;
+positions are renumbered once after the cells were rearranged.
+"""
+import ast
+import itertools
+
+PREAMBLE_MARKER = "#%%---%%"
+CELL_SEPARATOR = "#---"
+DEFAULT_PREAMBLE = "#%%---%%\n# Warning: portions of this code were automatically generated by Pydonia\n# attempting to edit the raw Python code may lead to undefined behavior\n# upon loading back into a Pydonia environment\nimport sympy as sp\n\nx, y, z = sp.symbols(\"x y z\")\n#%%---%%\n"
+
+_cell_ids = itertools.count(1)
+
+
+def preamble_imports(preamble):
+    """Top level packages the preamble imports, in order; the ones worth importing before a notebook opens."""
+    try:
+        tree = ast.parse(preamble)
+    except SyntaxError:
+        return []
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            package = name.partition(".")[0]
+            if package not in modules:
+                modules.append(package)
+    return modules
+
+
+class Cell:
+    def __init__(self, source=""):
+        self.id = next(_cell_ids)
+        self.source = source
+        self.output = ""
+        self.state = "idle"  # idle, queued, ok, error or cancelled
+        self.dirty = False  # changed since the notebook was last saved
+        self.metrics = {}  # what the last run cost, see CodeCapture.last_metrics
+
+
+class Notebook:
+    def __init__(self, path=None, preamble=DEFAULT_PREAMBLE, cells=None):
+        self.path = path
+        self.preamble = preamble
+        self.cells = []
+        self._by_id = {}
+        self._positions = {}  # cell id -> position, None after the cells were rearranged
+        self._dirty_cells = set()
+        self.structure_dirty = False  # cells were inserted or deleted since the last save
+        self.warnings = []  # problems found while parsing
+        self.preamble_metrics = {}
+        for cell in cells or ():
+            self.cells.append(cell)
+            self._by_id[cell.id] = cell
+            self._positions[cell.id] = len(self.cells) - 1
+
+    @classmethod
+    def parse(cls, text, path=None, default_preamble=DEFAULT_PREAMBLE):
+        lines = text.splitlines(keepends=True)
+        notebook = cls(path, default_preamble)
+
+        # the preamble runs from the first line, a marker, to the next marker
+        if lines and lines[0].strip() == PREAMBLE_MARKER:
+            for end, line in enumerate(lines[1:], start=1):
+                if line.strip() == PREAMBLE_MARKER:
+                    notebook.preamble = "".join(lines[:end + 1])
+                    del lines[:end + 1]
+                    break
+            else:
+                notebook.warnings.append("Unable to identify preamble, using default. Some features may not work as intended")
+
+        # cells are separated by lines that are exactly "#---"
+        segments = []
+        current_lines = []
+        for line in lines:
+            if line.strip() == CELL_SEPARATOR:
+                # the newline before a separator belongs to the separator
+                if current_lines and current_lines[-1].endswith('\n'):
+                    current_lines[-1] = current_lines[-1][:-1]
+                segments.append(''.join(current_lines))
+                current_lines = []
+            else:
+                current_lines.append(line)
+        segments.append(''.join(current_lines))
+
+        for source in segments:
+            notebook.append(Cell(source))
+        notebook.mark_saved()
+        return notebook
+
+    @classmethod
+    def load(cls, path, default_preamble=DEFAULT_PREAMBLE):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.parse(f.read(), path, default_preamble)
+
+    def text(self):
+        """The notebook as it is written to its file."""
+        return self.preamble + f"\n{CELL_SEPARATOR}\n".join(cell.source for cell in self.cells)
+
+    def save(self, path=None):
+        path = path or self.path
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.text())
+        self.path = path
+        self.mark_saved()
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return iter(self.cells)
+
+    def __getitem__(self, position):
+        return self.cells[position]
+
+    def cell(self, cell_id):
+        return self._by_id.get(cell_id)
+
+    def index(self, cell):
+        if self._positions is None:
+            self._positions = {c.id: i for i, c in enumerate(self.cells)}
+        return self._positions[cell.id]
+
+    def insert(self, position, cell=None):
+        cell = cell or Cell()
+        self.cells.insert(position, cell)
+        self._by_id[cell.id] = cell
+        if position >= len(self.cells) - 1 and self._positions is not None:
+            self._positions[cell.id] = len(self.cells) - 1
+        else:
+            self._positions = None
+        self.structure_dirty = True
+        return cell
+
+    def append(self, cell=None):
+        return self.insert(len(self.cells), cell)
+
+    def remove(self, cell):
+        self.cells.pop(self.index(cell))
+        del self._by_id[cell.id]
+        self._dirty_cells.discard(cell.id)
+        self._positions = None
+        self.structure_dirty = True
+
+    def set_dirty(self, cell, dirty=True):
+        cell.dirty = dirty
+        if dirty:
+            self._dirty_cells.add(cell.id)
+        else:
+            self._dirty_cells.discard(cell.id)
+
+    @property
+    def dirty(self):
+        return self.structure_dirty or bool(self._dirty_cells)
+
+    def mark_saved(self):
+        for cell_id in self._dirty_cells:
+            self._by_id[cell_id].dirty = False
+        self._dirty_cells.clear()
+        self.structure_dirty = False
@@ -0,0 +1,795 @@
+# notebookView.py
+"""
+The widget of a notebook tab.
+
+A text edit and a label for every cell means a notebook of a few thousand cells
+creates, lays out and keeps thousands of widgets and text documents before its
+tab even shows. Here the cells are rows of a CellListModel shown by a NotebookView:
+CellDelegate paints the source, output and metrics of the rows on screen straight
+from the cells, and only the cell being edited gets a real TextEdit, opened as a
+persistent editor over its row and closed again when another cell is edited.
+
+Row heights are worked out from font metrics and kept per cell until its source,
+output, metrics or the width change. NotebookView lays the rows out itself (see
+RowHeights), so a row changing height costs the same however many rows there are.
+The source is painted highlighted, with the spans the editor's CellHighlighter
+gives it, from text layouts kept for the rows painted last.
+"""
+from collections import OrderedDict
+
+from PyQt6 import QtCore, QtGui, QtWidgets
+from PyQt6.QtCore import Qt, pyqtSignal
+
+import cellHighlighter
+import outputSpool
+import pipelineTrace
+from formatting import format_bytes, format_seconds
+from textEditWidget import TextEdit
+
+EDITOR_BACKGROUND = "#383838"
+DOCUMENT_MARGIN = 4  # QTextDocument's default, the painted source lines up with the editor
+MIN_EDITOR_HEIGHT = 20
+NOTE_MARGIN = 4  # above and below the note in place of a long output's middle
+CELL_SPACING = 2
+GUTTER_SPACING = 8
+LAYOUT_CACHE = 200  # cells whose highlighted source layouts are kept, a few screens full
+
+
+def metrics_summary(metrics):
+    """Run time and peak memory, the lines shown right of a cell's output."""
+    if not metrics:
+        return []
+    lines = [format_seconds(metrics.get("wall", 0))]
+    if metrics.get("cached"):
+        lines[0] += " (cached)"
+    if "peak_memory" in metrics:
+        lines.append(format_bytes(metrics["peak_memory"]))
+    return lines
+
+
+def metrics_details(metrics):
+    """Everything measured on the last run, for the gutter's tooltip."""
+    details = []
+    for name, label in (("queue_wait", "Waited"), ("compile", "Compile"), ("wall", "Wall"), ("cpu", "CPU")):
+        if name in metrics:
+            details.append(f"{label}: {format_seconds(metrics[name])}")
+    if "peak_memory" in metrics:
+        details.append(f"Peak memory allocated: {format_bytes(metrics['peak_memory'])}")
+    if "memory_delta" in metrics:
+        delta = metrics["memory_delta"]
+        details.append(f"Memory change: {'-' if delta < 0 else '+'}{format_bytes(abs(delta))}")
+    if metrics.get("output_dropped"):
+        details.append(f"Output dropped: {metrics['output_dropped']:,} characters")
+    return "\n".join(details)
+
+
+class CellListModel(QtCore.QAbstractListModel):
+    """One row per cell of a notebook. Cells are added and removed through the model so views follow."""
+
+    def __init__(self, notebook, parent=None):
+        super().__init__(parent)
+        self.notebook = notebook
+        self.shown_outputs = {}  # cell id -> what a running cell printed so far, shown instead of its output
+        self.spool_paths = {}  # cell id -> the full output on disk when it was too long to show
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.notebook)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        cell = self.notebook[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return cell.source
+        return None
+
+    def output(self, cell):
+        return self.shown_outputs.get(cell.id, cell.output)
+
+    def index_of(self, cell):
+        return self.index(self.notebook.index(cell))
+
+    def cell_changed(self, cell):
+        if self.notebook.cell(cell.id) is None:
+            # deleted in the meantime
+            return
+        index = self.index_of(cell)
+        self.dataChanged.emit(index, index)
+
+    def show_output(self, cell, text=None):
+        """Show text as the cell's output, or the cell's own output again if text is None."""
+        if text is None:
+            self.shown_outputs.pop(cell.id, None)
+        else:
+            self.shown_outputs[cell.id] = text
+        self.cell_changed(cell)
+
+    def append_cell(self):
+        row = len(self.notebook)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        cell = self.notebook.append()
+        self.endInsertRows()
+        return cell
+
+    def remove_cell(self, cell):
+        row = self.notebook.index(cell)
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        self.notebook.remove(cell)
+        self.shown_outputs.pop(cell.id, None)
+        self.endRemoveRows()
+
+
+class CellDelegate(QtWidgets.QStyledItemDelegate):
+    """
+    Paints a cell as its editor and output label would look: the source on the editor's
+    background, the output below it and the metrics gutter right of the output.
+    """
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.source_font = QtGui.QFont("Times New Roman", 14)
+        self.gutter_font = QtGui.QFont("Times New Roman", 9)
+        self.source_metrics = QtGui.QFontMetrics(self.source_font)
+        self.gutter_metrics = QtGui.QFontMetrics(self.gutter_font)
+        self.heights = {}  # cell id -> (width, source, output, metrics, height) it was measured for
+        self.source_heights = {}  # cell id -> (width, source, height of the source alone)
+        self.previews = {}  # cell id -> (output, its preview), splitting megabytes on every paint is too slow
+        self.layouts = OrderedDict()  # cell id -> (width, source, height, [(top, text layout)]), least recently used first
+        self.text_option = QtGui.QTextOption()
+        self.text_option.setWrapMode(QtGui.QTextOption.WrapMode.WrapAtWordBoundaryOrAnywhere)
+        self.text_option.setTabStopDistance(4 * self.source_metrics.horizontalAdvance(" "))
+
+    def forget(self, cell):
+        self.heights.pop(cell.id, None)
+        self.source_heights.pop(cell.id, None)
+        self.previews.pop(cell.id, None)
+        self.layouts.pop(cell.id, None)
+
+    # measuring
+
+    def _source_layouts(self, cell, width):
+        """The source's lines laid out and highlighted as the editor would, [(top, text layout)], and their height."""
+        cached = self.layouts.get(cell.id)
+        if cached is not None and cached[0] == width and cached[1] is cell.source:
+            self.layouts.move_to_end(cell.id)
+            return cached[3], cached[2]
+        text = cell.source
+        kinds = cellHighlighter.formats()
+        line_width = max(1, width - 2 * DOCUMENT_MARGIN)
+        layouts = []
+        top = DOCUMENT_MARGIN
+        state = 0
+        for line in text.split("\n"):
+            spans, state = cellHighlighter.tokenize(line, state)
+            layout = QtGui.QTextLayout(line, self.source_font)
+            layout.setTextOption(self.text_option)
+            ranges = []
+            for start, length, kind in cellHighlighter.utf16_spans(line, spans):
+                text_range = QtGui.QTextLayout.FormatRange()
+                text_range.start, text_range.length, text_range.format = start, length, kinds[kind]
+                ranges.append(text_range)
+            layout.setFormats(ranges)
+            layout.beginLayout()
+            y = 0
+            while True:
+                text_line = layout.createLine()
+                if not text_line.isValid():
+                    break
+                text_line.setLineWidth(line_width)
+                text_line.setPosition(QtCore.QPointF(0, y))
+                y += text_line.height()
+            layout.endLayout()
+            layouts.append((top, layout))
+            top += y
+        height = max(MIN_EDITOR_HEIGHT, int(top) + DOCUMENT_MARGIN)
+        self.layouts[cell.id] = (width, text, height, layouts)
+        if len(self.layouts) > LAYOUT_CACHE:
+            self.layouts.popitem(last=False)
+        self.source_heights[cell.id] = (width, text, height)
+        return layouts, height
+
+    def _source_height(self, cell, width):
+        cached = self.source_heights.get(cell.id)
+        if cached is not None and cached[0] == width and cached[1] is cell.source:
+            return cached[2]
+        return self._source_layouts(cell, width)[1]
+
+    def _editor_height(self, editor):
+        # a plain text document measures itself in lines, the blocks know their pixels;
+        # they are placed relative to the first block on screen, the editor may have scrolled
+        document = editor.document()
+        top = editor.blockBoundingGeometry(document.firstBlock()).top()
+        bottom = editor.blockBoundingGeometry(document.lastBlock()).bottom()
+        return max(MIN_EDITOR_HEIGHT, int(bottom - top + document.documentMargin()))
+
+    def _output_parts(self, model, cell):
+        """(head, note, tail) of the output, note and tail are None unless it is too long to show whole."""
+        output = model.output(cell)
+        if not outputSpool.too_long(output):
+            return output.removesuffix("\n"), None, None
+        cached = self.previews.get(cell.id)
+        if cached is None or cached[0] is not output:
+            cached = self.previews[cell.id] = (output, outputSpool.preview(output.removesuffix("\n")))
+        return cached[1]
+
+    def _lines_height(self, text):
+        return (text.count("\n") + 1) * self.source_metrics.lineSpacing() if text else 0
+
+    def _output_height(self, model, cell):
+        head, note, tail = self._output_parts(model, cell)
+        height = self._lines_height(head)
+        if note is not None:
+            height += self.source_metrics.lineSpacing() + 2 * NOTE_MARGIN + self._lines_height(tail)
+        gutter = len(metrics_summary(cell.metrics)) * self.gutter_metrics.lineSpacing()
+        return max(height, gutter)
+
+    def estimate_height(self, model, cell):
+        """A cheap guess at the row height, for rows that were not measured yet: lines times line spacing, no wrapping."""
+        output = model.output(cell)
+        if outputSpool.too_long(output):
+            output_lines = outputSpool.HEAD_LINES + outputSpool.TAIL_LINES + 1
+        else:
+            output_lines = output.count("\n") + 1 if output else 0
+        lines = cell.source.count("\n") + 1 + output_lines
+        return lines * self.source_metrics.lineSpacing() + 2 * DOCUMENT_MARGIN + CELL_SPACING
+
+    def sizeHint(self, option, index):
+        model = index.model()
+        cell = model.notebook[index.row()]
+        width = self.view.viewport().width()
+        editor = self.view.editor
+        if editor is not None and editor.cell is cell:
+            # follows the editor as it is typed into, not worth caching
+            return QtCore.QSize(width, self._editor_height(editor) + self._output_height(model, cell) + CELL_SPACING)
+
+        output = model.output(cell)
+        cached = self.heights.get(cell.id)
+        if (cached is not None and cached[0] == width and cached[1] is cell.source
+                and cached[2] is output and cached[3] is cell.metrics):
+            return QtCore.QSize(width, cached[4])
+        height = self._source_height(cell, width) + self._output_height(model, cell) + CELL_SPACING
+        self.heights[cell.id] = (width, cell.source, output, cell.metrics, height)
+        return QtCore.QSize(width, height)
+
+    def source_rect(self, option, index):
+        """Where the source is painted, and the editor goes."""
+        model = index.model()
+        cell = model.notebook[index.row()]
+        editor = self.view.editor
+        if editor is not None and editor.cell is cell:
+            height = self._editor_height(editor)
+        else:
+            height = self._source_height(cell, option.rect.width())
+        return QtCore.QRect(option.rect.x(), option.rect.y(), option.rect.width(), height)
+
+    def _note_rect(self, output_rect, head):
+        top = output_rect.y() + self._lines_height(head) + NOTE_MARGIN
+        return QtCore.QRect(output_rect.x(), top, output_rect.width(), self.source_metrics.lineSpacing())
+
+    def note_rect(self, option, index):
+        """Where the note of a long output is painted, None if the output is shown whole."""
+        model = index.model()
+        cell = model.notebook[index.row()]
+        head, note, _ = self._output_parts(model, cell)
+        if note is None:
+            return None
+        source = self.source_rect(option, index)
+        output_rect = QtCore.QRect(option.rect.x(), source.bottom() + 1, option.rect.width(), option.rect.height())
+        return self._note_rect(output_rect, head)
+
+    def gutter_rect(self, option, index):
+        model = index.model()
+        cell = model.notebook[index.row()]
+        lines = metrics_summary(cell.metrics)
+        if not lines:
+            return None
+        source = self.source_rect(option, index)
+        width = max(self.gutter_metrics.horizontalAdvance(line) for line in lines)
+        height = len(lines) * self.gutter_metrics.lineSpacing()
+        return QtCore.QRect(option.rect.right() - width, source.bottom() + 1, width, height)
+
+    # painting
+
+    def paint(self, painter, option, index):
+        model = index.model()
+        cell = model.notebook[index.row()]
+        rect = option.rect
+        source = self.source_rect(option, index)
+        text_color = option.palette.color(QtGui.QPalette.ColorRole.Text)
+
+        painter.save()
+        painter.fillRect(source, QtGui.QColor(EDITOR_BACKGROUND))
+        editor = self.view.editor
+        if editor is None or editor.cell is not cell:
+            painter.setPen(text_color)
+            layouts, _ = self._source_layouts(cell, rect.width())
+            # only the lines on screen, a cell can be thousands of lines long
+            visible = self.view.viewport().rect()
+            for top, layout in layouts:
+                y = source.y() + top
+                if y > visible.bottom():
+                    break
+                if y + layout.boundingRect().bottom() < visible.top():
+                    continue
+                layout.draw(painter, QtCore.QPointF(source.x() + DOCUMENT_MARGIN, y))
+
+        gutter = self.gutter_rect(option, index)
+        output_rect = QtCore.QRect(rect.x(), source.bottom() + 1, rect.width(), rect.bottom() - source.bottom())
+        if gutter is not None:
+            output_rect.setRight(gutter.left() - GUTTER_SPACING)
+            painter.setFont(self.gutter_font)
+            painter.setPen(QtGui.QColor("gray"))
+            painter.drawText(gutter, Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignTop, "\n".join(metrics_summary(cell.metrics)))
+
+        head, note, tail = self._output_parts(model, cell)
+        painter.setClipRect(output_rect)
+        painter.setFont(self.source_font)
+        painter.setPen(text_color)
+        painter.drawText(output_rect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop, head)
+        if note is not None:
+            note_rect = self._note_rect(output_rect, head)
+            if cell.id in model.spool_paths:
+                note += " open the full output"
+                painter.setPen(option.palette.color(QtGui.QPalette.ColorRole.Link))
+            else:
+                painter.setPen(QtGui.QColor("gray"))
+            painter.drawText(note_rect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop, note)
+            painter.setPen(text_color)
+            tail_rect = QtCore.QRect(output_rect.x(), note_rect.bottom() + 1 + NOTE_MARGIN, output_rect.width(), output_rect.height())
+            painter.drawText(tail_rect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop, tail)
+        painter.restore()
+
+    def helpEvent(self, event, view, option, index):
+        # the metrics of the last run, only over the gutter
+        if event.type() == QtCore.QEvent.Type.ToolTip and index.isValid():
+            gutter = self.gutter_rect(option, index)
+            if gutter is not None and gutter.contains(event.pos()):
+                cell = index.model().notebook[index.row()]
+                QtWidgets.QToolTip.showText(event.globalPos(), metrics_details(cell.metrics), view)
+                return True
+            QtWidgets.QToolTip.hideText()
+            return True
+        return super().helpEvent(event, view, option, index)
+
+    # editing
+
+    def createEditor(self, parent, option, index):
+        cell = index.model().notebook[index.row()]
+        editor = TextEdit()
+        editor.setParent(parent)
+        editor.cell = cell
+        editor.view = self.view
+        editor.setFrameShape(QtWidgets.QFrame.Shape.NoFrame)
+        editor.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        editor.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        editor.setStyleSheet(f"background-color: {EDITOR_BACKGROUND};")
+        editor.setFont(self.source_font)
+        editor.document().setDefaultFont(self.source_font)
+        editor.document().setDocumentMargin(DOCUMENT_MARGIN)
+        editor.setTabStopDistance(4 * editor.fontMetrics().horizontalAdvance(" "))
+        editor.highlighter = cellHighlighter.CellHighlighter(editor.document())
+        editor.setPlainText(cell.source)
+        editor.cellRunRequest.connect(self.view.cellRunRequest)
+        editor.deleteRequested.connect(self.view.deleteRequested)
+        # the cell follows what is typed, running and saving read it from there
+        editor.textChanged.connect(lambda e=editor: self.view.on_text_changed(e))
+        editor.document().documentLayout().documentSizeChanged.connect(lambda _, e=editor: self.view.fit_editor(e))
+        return editor
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(self.source_rect(option, index))
+        # it scrolls to keep the cursor in view until it has grown to fit, then there is nothing to scroll
+        editor.verticalScrollBar().setValue(0)
+
+    def setEditorData(self, editor, index):
+        # the editor is the only place its cell is changed, there is nothing to bring back
+        pass
+
+    def setModelData(self, editor, model, index):
+        pass
+
+
+class RowHeights:
+    """
+    The height of every row and where each row starts, kept in a Fenwick tree: changing the
+    height of one row, the top of a row and the row at a given y all take O(log rows).
+    Inserting and removing rows rebuilds the tree, which only happens a cell at a time.
+    """
+
+    def __init__(self, heights=()):
+        self.rebuild(heights)
+
+    def rebuild(self, heights):
+        self.heights = list(heights)
+        size = len(self.heights)
+        tree = [0] * (size + 1)
+        for i, height in enumerate(self.heights, start=1):
+            tree[i] += height
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def __len__(self):
+        return len(self.heights)
+
+    def set(self, row, height):
+        """Change the height of a row, returns whether it changed."""
+        delta = height - self.heights[row]
+        if not delta:
+            return False
+        self.heights[row] = height
+        i = row + 1
+        size = len(self.heights)
+        while i <= size:
+            self.tree[i] += delta
+            i += i & -i
+        return True
+
+    def top(self, row):
+        """Sum of the heights of the rows before row."""
+        total = 0
+        while row > 0:
+            total += self.tree[row]
+            row -= row & -row
+        return total
+
+    def total(self):
+        return self.top(len(self.heights))
+
+    def row_at(self, y):
+        """The row covering y, len(self) past the last row."""
+        if y < 0:
+            return 0
+        row = 0
+        step = 1 << len(self.heights).bit_length()
+        while step:
+            if row + step <= len(self.heights) and self.tree[row + step] <= y:
+                row += step
+                y -= self.tree[row]
+            step >>= 1
+        return row
+
+    def insert(self, row, heights):
+        self.rebuild(self.heights[:row] + list(heights) + self.heights[row:])
+
+    def remove(self, row, count):
+        self.rebuild(self.heights[:row] + self.heights[row + count:])
+
+
+class NotebookView(QtWidgets.QAbstractItemView):
+    """
+    The cells of a notebook, only the one being edited has an editor (see edit_cell).
+    The editor's Shift+Enter and Shift+Backspace come out as cellRunRequest and
+    deleteRequested, with the editor; cellEdited is emitted when a cell first
+    differs from the saved file.
+
+    Row heights are kept in a RowHeights. A row starts with an estimate and is measured
+    by the delegate once it is on screen. Cells that changed (typed into, new output) are
+    remeasured at most once per pass of the event loop (update_row_heights), and only if
+    they are on screen; off screen they are remeasured when they are scrolled to. Typing
+    into one cell therefore costs the same in a notebook of ten cells or ten thousand.
+    """
+    cellRunRequest = pyqtSignal(QtWidgets.QPlainTextEdit)
+    deleteRequested = pyqtSignal(QtWidgets.QPlainTextEdit)
+    cellEdited = pyqtSignal(object)
+    outputLinkActivated = pyqtSignal(object)
+    insertRequested = pyqtSignal()
+
+    INSERT_BUTTON_HEIGHT = 35
+
+    def __init__(self, notebook, parent=None):
+        super().__init__(parent)
+        self.notebook = notebook
+        self.editor = None  # the TextEdit of the cell being edited
+        self.rows = RowHeights()
+        self.changed_cells = set()  # cells to remeasure on the next update_row_heights
+        self.stale_cells = set()  # ids of off screen cells to remeasure when they are scrolled to
+        self.geometry_changed = False  # rows were measured while scrolling, the scroll range is behind
+        self.measured_width = None
+
+        # height changes are applied once per pass of the event loop, however many came in
+        self.height_timer = QtCore.QTimer(self)
+        self.height_timer.setSingleShot(True)
+        self.height_timer.setInterval(0)
+        self.height_timer.timeout.connect(self.update_row_heights)
+
+        self.delegate = CellDelegate(self)
+        self.setItemDelegate(self.delegate)
+        self.cell_model = CellListModel(notebook, self)
+        self.setModel(self.cell_model)
+        self._estimate_all()
+
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.verticalScrollBar().setSingleStep(20)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.NoSelection)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setFont(self.delegate.source_font)
+
+        self.newCell = QtWidgets.QPushButton("Click to insert a new cell", self)
+        self.newCell.setFont(QtGui.QFont("Times New Roman", 10))
+        self.newCell.clicked.connect(self.insertRequested)
+        effect = QtWidgets.QGraphicsOpacityEffect(self.newCell)
+        self.newCell.setGraphicsEffect(effect)
+        effect.setOpacity(0.0)
+        self.newCell.enterEvent = lambda e: effect.setOpacity(1.0)
+        self.newCell.leaveEvent = lambda e: effect.setOpacity(0.0)
+        self.setViewportMargins(0, 0, 0, self.INSERT_BUTTON_HEIGHT)
+
+    # row heights
+
+    def _estimate_all(self):
+        """Guess every row's height and leave the measuring to when rows are on screen."""
+        self.rows.rebuild(self.delegate.estimate_height(self.cell_model, cell) for cell in self.notebook)
+        self.stale_cells = {cell.id for cell in self.notebook}
+        self.changed_cells.clear()
+
+    def _visible_rows(self):
+        offset = self.verticalOffset()
+        first = self.rows.row_at(offset)
+        last = min(len(self.rows) - 1, self.rows.row_at(offset + self.viewport().height()))
+        return range(first, last + 1)
+
+    def _measure(self, row):
+        index = self.cell_model.index(row)
+        option = self.item_option(index)
+        return self.rows.set(row, self.delegate.sizeHint(option, index).height())
+
+    def _measure_visible(self):
+        """Measure the stale rows that are on screen, returns whether any height changed."""
+        changed = False
+        if self.stale_cells:
+            for row in self._visible_rows():
+                cell = self.notebook[row]
+                if cell.id in self.stale_cells:
+                    self.stale_cells.discard(cell.id)
+                    changed |= self._measure(row)
+        return changed
+
+    def cell_changed(self, cell):
+        """The height of the cell's row may have changed."""
+        self.changed_cells.add(cell)
+        if not self.height_timer.isActive():
+            self.height_timer.start()
+
+    def update_row_heights(self):
+        """Remeasure the cells that changed since the last call, or mark them stale if they are off screen."""
+        self.height_timer.stop()
+        changed_cells, self.changed_cells = self.changed_cells, set()
+        with pipelineTrace.span("update_row_heights", cells=len(changed_cells)):
+            changed, self.geometry_changed = self.geometry_changed, False
+            visible = self._visible_rows()
+            for cell in changed_cells:
+                if self.notebook.cell(cell.id) is None:
+                    continue
+                row = self.notebook.index(cell)
+                if row in visible:
+                    self.stale_cells.discard(cell.id)
+                    changed |= self._measure(row)
+                else:
+                    self.stale_cells.add(cell.id)
+            # rows that moved into the viewport because a row above got shorter
+            changed |= self._measure_visible()
+            if changed:
+                self.updateGeometries()
+                self.viewport().update()
+
+    # QAbstractItemView
+
+    def item_option(self, index):
+        option = QtWidgets.QStyleOptionViewItem()
+        self.initViewItemOption(option)
+        option.rect = self.visualRect(index)
+        return option
+
+    def visualRect(self, index):
+        if not index.isValid() or index.row() >= len(self.rows):
+            return QtCore.QRect()
+        row = index.row()
+        return QtCore.QRect(0, self.rows.top(row) - self.verticalOffset(), self.viewport().width(), self.rows.heights[row])
+
+    def indexAt(self, point):
+        row = self.rows.row_at(point.y() + self.verticalOffset())
+        if row >= len(self.rows):
+            return QtCore.QModelIndex()
+        return self.cell_model.index(row)
+
+    def scrollTo(self, index, hint=QtWidgets.QAbstractItemView.ScrollHint.EnsureVisible):
+        if not index.isValid():
+            return
+        row = index.row()
+        if self.notebook[row].id in self.stale_cells:
+            self.stale_cells.discard(self.notebook[row].id)
+            if self._measure(row):
+                self.updateGeometries()
+        top, height = self.rows.top(row), self.rows.heights[row]
+        offset, visible = self.verticalOffset(), self.viewport().height()
+        Hint = QtWidgets.QAbstractItemView.ScrollHint
+        if hint == Hint.PositionAtTop or (hint == Hint.EnsureVisible and (top < offset or height > visible)):
+            value = top
+        elif hint == Hint.PositionAtBottom or (hint == Hint.EnsureVisible and top + height > offset + visible):
+            value = top + height - visible
+        elif hint == Hint.PositionAtCenter:
+            value = top + (height - visible) // 2
+        else:
+            return
+        self.verticalScrollBar().setValue(value)
+
+    def moveCursor(self, action, modifiers):
+        row = self.currentIndex().row()
+        Action = QtWidgets.QAbstractItemView.CursorAction
+        if action in (Action.MoveUp, Action.MovePrevious):
+            row -= 1
+        elif action in (Action.MoveDown, Action.MoveNext):
+            row += 1
+        elif action == Action.MovePageUp:
+            row = self.rows.row_at(self.rows.top(max(row, 0)) - self.viewport().height())
+        elif action == Action.MovePageDown:
+            row = self.rows.row_at(self.rows.top(max(row, 0)) + self.viewport().height())
+        elif action == Action.MoveHome:
+            row = 0
+        elif action == Action.MoveEnd:
+            row = len(self.rows) - 1
+        return self.cell_model.index(max(0, min(row, len(self.rows) - 1)))
+
+    def horizontalOffset(self):
+        return 0
+
+    def verticalOffset(self):
+        return self.verticalScrollBar().value()
+
+    def isIndexHidden(self, index):
+        return False
+
+    def setSelection(self, rect, command):
+        # cells are not selected, only edited
+        pass
+
+    def visualRegionForSelection(self, selection):
+        return QtGui.QRegion()
+
+    def updateGeometries(self):
+        visible = self.viewport().height()
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.setPageStep(visible)
+        scroll_bar.setRange(0, max(0, self.rows.total() - visible))
+        super().updateGeometries()
+
+    def reset(self):
+        super().reset()
+        self.editor = None
+        self._estimate_all()
+        self._measure_visible()
+        self.updateGeometries()
+
+    def rowsInserted(self, parent, start, end):
+        cells = self.notebook[start:end + 1]
+        self.rows.insert(start, [self.delegate.estimate_height(self.cell_model, cell) for cell in cells])
+        self.stale_cells.update(cell.id for cell in cells)
+        super().rowsInserted(parent, start, end)
+        self._measure_visible()
+        self.updateGeometries()
+        self.viewport().update()
+
+    def rowsAboutToBeRemoved(self, parent, start, end):
+        # the view deletes the editor of a removed row itself
+        if self.editor is not None and start <= self.notebook.index(self.editor.cell) <= end:
+            self.editor = None
+        super().rowsAboutToBeRemoved(parent, start, end)
+        for cell in self.notebook[start:end + 1]:
+            self.stale_cells.discard(cell.id)
+            self.changed_cells.discard(cell)
+        self.rows.remove(start, end - start + 1)
+        # the model still has the rows until it has removed them, measure what moved up afterwards
+        self.height_timer.start()
+        self.updateGeometries()
+        self.viewport().update()
+
+    def dataChanged(self, top_left, bottom_right, roles=()):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            self.cell_changed(self.notebook[row])
+        super().dataChanged(top_left, bottom_right, roles)
+
+    def scrollContentsBy(self, dx, dy):
+        if self._measure_visible():
+            # scrolled onto rows that were only estimated
+            self.geometry_changed = True
+            self.height_timer.start()
+            self.viewport().update()
+        else:
+            self.viewport().scroll(dx, dy)
+        if self.editor is not None:
+            self.updateEditorGeometries()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        viewport = self.viewport().geometry()
+        self.newCell.setGeometry(viewport.x(), viewport.bottom() + 1, viewport.width(), self.INSERT_BUTTON_HEIGHT)
+        if self.viewport().width() != self.measured_width:
+            # every height depends on the width: guess again, measure what is on screen
+            self.measured_width = self.viewport().width()
+            self._estimate_all()
+        self._measure_visible()
+        self.updateGeometries()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self.viewport())
+        option = QtWidgets.QStyleOptionViewItem()
+        self.initViewItemOption(option)
+        width, bottom = self.viewport().width(), event.rect().bottom()
+        offset = self.verticalOffset()
+        row = self.rows.row_at(offset + event.rect().top())
+        top = self.rows.top(row) - offset
+        while row < len(self.rows) and top <= bottom:
+            height = self.rows.heights[row]
+            option.rect = QtCore.QRect(0, top, width, height)
+            self.delegate.paint(painter, option, self.cell_model.index(row))
+            top += height
+            row += 1
+        painter.end()
+
+    # editing
+
+    def edit_cell(self, cell):
+        """Give the cell the editor, and the editor the focus. Returns the editor."""
+        if self.editor is not None and self.editor.cell is cell:
+            self.editor.setFocus()
+            return self.editor
+        self.close_editor()
+        index = self.cell_model.index_of(cell)
+        self.setCurrentIndex(index)
+        self.openPersistentEditor(index)
+        self.editor = self.indexWidget(index)
+        # its row is now as high as the editor
+        self.delegate.forget(cell)
+        self.cell_changed(cell)
+        self.scrollTo(index)
+        self.editor.setFocus()
+        return self.editor
+
+    def close_editor(self):
+        if self.editor is None:
+            return
+        cell, self.editor = self.editor.cell, None
+        self.closePersistentEditor(self.cell_model.index_of(cell))
+        self.cell_changed(cell)
+
+    def append_cell(self):
+        return self.cell_model.append_cell()
+
+    def remove_cell(self, cell):
+        self.delegate.forget(cell)
+        self.cell_model.remove_cell(cell)
+
+    def on_text_changed(self, editor):
+        cell = editor.cell
+        cell.source = editor.toPlainText()
+        if not cell.dirty:
+            self.notebook.set_dirty(cell)
+            self.cellEdited.emit(cell)
+
+    def fit_editor(self, editor):
+        """Make the row of the edited cell as high as its editor's contents, on the next update_row_heights."""
+        if editor is self.editor:
+            self.cell_changed(editor.cell)
+
+    def mousePressEvent(self, event):
+        index = self.indexAt(event.position().toPoint())
+        if not index.isValid() or event.button() != Qt.MouseButton.LeftButton:
+            super().mousePressEvent(event)
+            return
+        pos = event.position().toPoint()
+        option = self.item_option(index)
+        cell = self.notebook[index.row()]
+
+        note = self.delegate.note_rect(option, index)
+        if note is not None and note.contains(pos) and cell.id in self.cell_model.spool_paths:
+            self.outputLinkActivated.emit(cell)
+            return
+        if self.delegate.source_rect(option, index).contains(pos):
+            editor = self.edit_cell(cell)
+            # the cursor goes where the cell was clicked
+            editor.setTextCursor(editor.cursorForPosition(editor.mapFrom(self.viewport(), pos)))
+            return
+        super().mousePressEvent(event)
@@ -0,0 +1,79 @@
+# outputSpool.py
+"""
+Cell outputs too long for a label.
+
+A QLabel lays out all of its text, so a cell that prints a few megabytes makes
+the whole notebook crawl. Outputs longer than THRESHOLD characters are written
+to a file instead and the notebook only shows the first and last lines
+(preview), with a link that opens the file in a PagedTextView.
+"""
+import os
+import shutil
+import tempfile
+
+THRESHOLD = 20_000  # characters, labels get sluggish well before a megabyte
+HEAD_LINES = 30
+TAIL_LINES = 10
+LINE_CHARS = 400  # longer preview lines are cut, one huge line is as bad as many
+
+
+def too_long(text):
+    return len(text) > THRESHOLD
+
+
+def _clip(line):
+    return line if len(line) <= LINE_CHARS else line[:LINE_CHARS] + " ..."
+
+
+def preview(text):
+    """(head, note, tail): the first and last lines of text and a note of what was left out between them."""
+    lines = text.split("\n")
+    if len(lines) > HEAD_LINES + TAIL_LINES:
+        head, tail = lines[:HEAD_LINES], lines[-TAIL_LINES:]
+    else:
+        # a few very long lines, only the first and the last are shown
+        head, tail = lines[:1], lines[1:][-1:]
+    skipped = len(lines) - len(head) - len(tail)
+    clipped = sum(len(line) - LINE_CHARS for line in head + tail if len(line) > LINE_CHARS)
+
+    hidden = []
+    if skipped:
+        hidden.append(f"{skipped:,} more lines")
+    if clipped:
+        hidden.append(f"{clipped:,} characters cut from long lines")
+
+    def block(part):
+        return "\n".join(_clip(line) for line in part)
+
+    return block(head), f"... {', '.join(hidden)} ...", block(tail)
+
+
+class OutputSpool:
+    """The files long outputs are kept in, all in one temporary folder removed by close()."""
+
+    def __init__(self):
+        self.directory = None
+        self.count = 0
+
+    def write(self, text):
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="pydonia-outputs-")
+        self.count += 1
+        path = os.path.join(self.directory, f"output{self.count}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def discard(self, path):
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            # already gone, or still open in a viewer on Windows
+            pass
+
+    def close(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
@@ -0,0 +1,288 @@
+import bisect
+import mmap
+import threading
+from array import array
+
+from PyQt6 import QtGui, QtWidgets
+from PyQt6.QtCore import Qt, pyqtSignal
+
+LARGE_FILE = 8 * 1024 * 1024  # bytes, text files bigger than this are opened in a PagedTextView, not a text edit
+INDEX_CHUNK = 4 * 1024 * 1024  # bytes indexed between updates of the view
+
+
+class LineIndex:
+    """
+    The lines of a file mapped into memory. A background thread finds where they start a chunk
+    at a time; the lines indexed so far can be read while it runs, and progress() is called
+    from the thread after every chunk.
+    """
+
+    def __init__(self, path, progress=None):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file cannot be mapped
+            self.data = b""
+        self.offsets = array("q", [0])  # where each line starts, plus where the last indexed line ends
+        self.widest = 0  # bytes in the longest line, close enough to its characters
+        self.done = False
+        self.closed = False
+        self.lock = threading.Lock()  # the thread reads the mapping, close() unmaps it
+        self.progress = progress
+        threading.Thread(target=self._index, name="line-indexer", daemon=True).start()
+
+    def _index(self):
+        data = self.data
+        size = len(data)
+        position = 0
+        line_start = 0
+        while True:
+            end = min(position + INDEX_CHUNK, size)
+            found_lines = array("q")
+            widest = self.widest
+            with self.lock:
+                if self.closed:
+                    return
+                found = data.find(b"\n", position, end)
+                while found != -1:
+                    line_end = found + 1
+                    widest = max(widest, line_end - line_start)
+                    found_lines.append(line_end)
+                    line_start = line_end
+                    found = data.find(b"\n", line_end, end)
+            position = end
+            if position == size and position > line_start:
+                # last line without a newline
+                widest = max(widest, position - line_start)
+                found_lines.append(position)
+            # the GUI thread reads the offsets without the lock, they only ever grow
+            self.widest = widest
+            self.offsets.extend(found_lines)
+            self.done = position == size
+            with self.lock:
+                if self.closed:
+                    return
+                if self.progress is not None:
+                    self.progress()
+            if self.done:
+                return
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if isinstance(self.data, mmap.mmap):
+                self.data.close()
+            self.file.close()
+
+    def line_count(self):
+        return len(self.offsets) - 1
+
+    def text(self, start, end):
+        return self.data[start:end].decode("utf-8", errors="replace")
+
+    def line(self, number, limit=None):
+        """The text of a line, of its first limit bytes if given."""
+        start, end = self.offsets[number], self.offsets[number + 1]
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.text(start, end).rstrip("\r\n")
+
+    def line_of(self, offset):
+        """The line the byte at offset is in, None if that part of the file is not indexed yet."""
+        if offset >= self.offsets[-1]:
+            return None
+        return bisect.bisect_right(self.offsets, offset) - 1
+
+    def find(self, needle, start, backwards=False):
+        """(offset, wrapped): the next needle from start on, or the last one before it, going round the end of the file."""
+        if backwards:
+            found = self.data.rfind(needle, 0, start)
+            if found == -1:
+                return self.data.rfind(needle, start), True
+        else:
+            found = self.data.find(needle, start)
+            if found == -1:
+                return self.data.find(needle, 0, start + len(needle) - 1), True
+        return found, False
+
+
+class PagedTextView(QtWidgets.QAbstractScrollArea):
+    """
+    Read only view of a text file that may be far too big for a text edit. The file stays on
+    disk, mapped into memory: a background thread indexes the offsets of its lines (LineIndex),
+    and painting reads and lays out only the lines in the viewport, so the first page shows
+    before the file is indexed. The scroll bars count lines and characters.
+
+    Ctrl+G goes to a line, Ctrl+F searches, F3 and Shift+F3 find the next and previous match.
+    """
+    indexed = pyqtSignal()  # more of the file is indexed, emitted from the indexing thread
+    message = pyqtSignal(str)  # for the status bar
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.current_line = None  # the line gone to or found last, marked
+        self.match = None  # (offset, length) of the last match, in bytes
+        self.search_text = ""
+        self.page_short = True  # the lines on screen ran out before the bottom of the view
+
+        self.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.SystemFont.FixedFont))
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.viewport().setBackgroundRole(QtGui.QPalette.ColorRole.Base)
+        self.indexed.connect(self._on_indexed)
+        self.index = LineIndex(path, self.indexed.emit)
+        # unmapped when the tab closes; the index, not the view, is kept by the connection
+        self.destroyed.connect(lambda _=None, index=self.index: index.close())
+        self._update_scroll_bars()
+
+    def line_count(self):
+        return self.index.line_count()
+
+    def line(self, number):
+        return self.index.line(number)
+
+    def _on_indexed(self):
+        self._update_scroll_bars()
+        if self.page_short:
+            # the page was painted before all of its lines were indexed
+            self.viewport().update()
+        if self.index.done:
+            self.message.emit(f"{self.path}: {self.line_count():,} lines")
+
+    def _line_height(self):
+        return self.fontMetrics().lineSpacing()
+
+    def _visible_lines(self):
+        return max(1, self.viewport().height() // self._line_height())
+
+    def _char_width(self):
+        return self.fontMetrics().horizontalAdvance("M")
+
+    def _update_scroll_bars(self):
+        visible = self._visible_lines()
+        vertical = self.verticalScrollBar()
+        vertical.setRange(0, max(0, self.line_count() - visible))
+        vertical.setPageStep(visible)
+        vertical.setSingleStep(1)
+
+        char_width = self._char_width()
+        horizontal = self.horizontalScrollBar()
+        horizontal.setRange(0, max(0, self.index.widest - self.viewport().width() // char_width + 1))
+        horizontal.setPageStep(max(1, self.viewport().width() // char_width))
+
+    # going to lines and searching
+
+    def go_to_line(self, number):
+        """Scroll line number (counted from 1) to the middle of the view and mark it."""
+        line = min(max(number, 1), max(self.line_count(), 1)) - 1
+        self.current_line = line
+        self.match = None
+        self._show_line(line)
+        self.viewport().update()
+
+    def _show_line(self, line):
+        vertical = self.verticalScrollBar()
+        if not vertical.value() <= line < vertical.value() + self._visible_lines():
+            vertical.setValue(line - self._visible_lines() // 2)
+
+    def _match_columns(self, line):
+        """(first column, columns) the match takes up in line once tabs are expanded."""
+        offset, length = self.match
+        before = self.index.text(self.index.offsets[line], offset)
+        through = before + self.index.text(offset, offset + length)
+        return len(before.expandtabs(4)), len(through.expandtabs(4)) - len(before.expandtabs(4))
+
+    def find_next(self, backwards=False):
+        """Go to the next match of search_text after the last one, or after the top of the view."""
+        if not self.search_text:
+            self.ask_find()
+            return
+        needle = self.search_text.encode("utf-8")
+        if self.match is not None:
+            start = self.match[0] if backwards else self.match[0] + 1
+        else:
+            start = self.index.offsets[min(self.verticalScrollBar().value(), self.line_count())]
+        found, wrapped = self.index.find(needle, start, backwards)
+        if found == -1:
+            self.message.emit(f"\"{self.search_text}\" not found")
+            return
+        line = self.index.line_of(found)
+        if line is None:
+            self.message.emit(f"\"{self.search_text}\" is further on than indexed yet, try again in a moment")
+            return
+        if wrapped:
+            self.message.emit("Search went round the end of the file")
+        self.match = (found, len(needle))
+        self.current_line = line
+        self._show_line(line)
+        column, length = self._match_columns(line)
+        horizontal = self.horizontalScrollBar()
+        if not horizontal.value() <= column <= column + length <= horizontal.value() + horizontal.pageStep():
+            horizontal.setValue(column - horizontal.pageStep() // 4)
+        self.viewport().update()
+
+    def ask_line(self):
+        count = max(self.line_count(), 1)
+        current = self.verticalScrollBar().value() + 1
+        number, ok = QtWidgets.QInputDialog.getInt(self, "Go to Line", f"Line (1 to {count:,}):", current, 1, count)
+        if ok:
+            self.go_to_line(number)
+
+    def ask_find(self):
+        text, ok = QtWidgets.QInputDialog.getText(self, "Find", "Find:", text=self.search_text)
+        if ok and text:
+            self.search_text = text
+            self.match = None
+            self.find_next()
+
+    def keyPressEvent(self, event):
+        if event.matches(QtGui.QKeySequence.StandardKey.Find):
+            self.ask_find()
+        elif event.matches(QtGui.QKeySequence.StandardKey.FindNext):
+            self.find_next()
+        elif event.matches(QtGui.QKeySequence.StandardKey.FindPrevious):
+            self.find_next(backwards=True)
+        elif event.modifiers() == Qt.KeyboardModifier.ControlModifier and event.key() == Qt.Key.Key_G:
+            self.ask_line()
+        else:
+            super().keyPressEvent(event)
+            return
+        event.accept()
+
+    # painting
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._update_scroll_bars()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self.viewport())
+        metrics = self.fontMetrics()
+        palette = self.palette()
+        line_height = self._line_height()
+        char_width = self._char_width()
+        width = self.viewport().width()
+        first = self.verticalScrollBar().value()
+        column = self.horizontalScrollBar().value()
+        columns = width // char_width + 2
+        match_line = self.index.line_of(self.match[0]) if self.match is not None else None
+
+        last = first + self._visible_lines() + 1
+        self.page_short = self.line_count() < last and not self.index.done
+        y = 0
+        for number in range(first, min(self.line_count(), last)):
+            if number == self.current_line:
+                painter.fillRect(0, y, width, line_height, palette.color(QtGui.QPalette.ColorRole.AlternateBase))
+            if number == match_line:
+                start, length = self._match_columns(number)
+                painter.fillRect((start - column) * char_width, y, length * char_width, line_height,
+                                 palette.color(QtGui.QPalette.ColorRole.Highlight))
+            # a line can be megabytes long, only read what can show (a character is at most 4 bytes)
+            text = self.index.line(number, limit=4 * (column + columns)).expandtabs(4)
+            painter.drawText(0, y + metrics.ascent(), text[column:column + columns])
+            y += line_height
+        painter.end()
@@ -0,0 +1,205 @@
+# parallelRun.py
+"""
+Runs a batch of cells at the same time on forked copies of the kernel (POSIX only).
+
+A forked child starts with the kernel's whole namespace, so it is a preloaded
+worker for free. It runs one cell, pickles the output and the values of the names
+the cell defines back through a pipe and exits; the kernel merges them into the
+notebook namespace. A cell is only started once every earlier batch cell it
+conflicts with has been merged: one that defines a name it reads (read after
+write), reads a name it defines (write after read) or defines the same name,
+unless both only import it. Cells that do not parse or star import conflict
+with everything before them.
+
+Results that can not be pickled are not lost: the cell is simply run again in
+the kernel itself.
+"""
+import os
+import pickle
+import selectors
+import signal
+
+import cellDeps
+from cellCache import dump_value, load_value
+
+
+def batch_dependencies(sources):
+    """For every cell, the indexes of the earlier cells of the batch it has to wait for."""
+    infos = [cellDeps.analyze(source) for source in sources]
+    deps = []
+    for j, info in enumerate(infos):
+        wait_for = set()
+        for i in range(j):
+            earlier = infos[i]
+            if info is None or earlier is None or info.star or earlier.star:
+                wait_for.add(i)
+            elif (info.uses & earlier.defines) or (info.defines & earlier.uses):
+                wait_for.add(i)
+            elif (info.defines & earlier.defines) - (info.imports & earlier.imports):
+                wait_for.add(i)
+        deps.append(wait_for)
+    return infos, deps
+
+
+def _die_with_parent():
+    # a killed kernel should not leave its children computing
+    try:
+        import ctypes
+        PR_SET_PDEATHSIG = 1
+        ctypes.CDLL(None).prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+    except Exception:
+        pass
+
+
+class Child:
+    def __init__(self, index, pid, fd, key):
+        self.index = index
+        self.pid = pid
+        self.fd = fd
+        self.key = key  # cache key, None if not cached
+        self.chunks = []
+        self.status = 0  # wait status of the exited child
+
+
+class ParallelRun:
+    def __init__(self, kernel, cells, max_workers=None):
+        self.kernel = kernel
+        self.cells = cells  # execute requests: dicts with id, code and cache_dir
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.infos, self.deps = batch_dependencies([cell["code"] for cell in cells])
+
+    @property
+    def namespace(self):
+        return self.kernel.capture.namespace
+
+    def result(self, index, status, output, cached=False, metrics=None):
+        self.kernel.send({"type": "result", "id": self.cells[index]["id"], "status": status, "output": output,
+                          "cached": cached, "metrics": metrics or {}})
+
+    def run_cell(self, cell):
+        return self.kernel.capture.run(cell["code"], None, cell.get("filename", "<string>"), cell.get("code_dir"),
+                                       output_limits=cell.get("output_limits"))
+
+    def run(self):
+        pending = list(range(len(self.cells)))
+        finished = set()
+        running = {}  # fd -> Child
+        selector = selectors.DefaultSelector()
+        try:
+            while pending or running:
+                for index in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+                    if not self.deps[index] <= finished:
+                        continue
+                    pending.remove(index)
+                    child = self.start(index)
+                    if child is None:
+                        # answered from the cache
+                        finished.add(index)
+                        continue
+                    running[child.fd] = child
+                    selector.register(child.fd, selectors.EVENT_READ, child)
+
+                if not running:
+                    continue
+
+                for selector_key, _ in selector.select():
+                    child = selector_key.data
+                    data = os.read(child.fd, 1 << 16)
+                    if data:
+                        child.chunks.append(data)
+                        continue
+                    selector.unregister(child.fd)
+                    os.close(child.fd)
+                    del running[child.fd]
+                    child.status = os.waitpid(child.pid, 0)[1]
+                    self.finish(child)
+                    finished.add(child.index)
+        except KeyboardInterrupt:
+            for child in running.values():
+                try:
+                    os.kill(child.pid, signal.SIGKILL)
+                    os.waitpid(child.pid, 0)
+                    os.close(child.fd)
+                except OSError:
+                    pass
+                self.result(child.index, "error", "KeyboardInterrupt")
+            for index in pending:
+                self.result(index, "cancelled", "Cancelled")
+        finally:
+            selector.close()
+
+    def start(self, index):
+        cell = self.cells[index]
+        cache = self.kernel.cache_for(cell.get("cache_dir"))
+        key = cache.key(cell["code"], self.namespace) if cache is not None else None
+        if key is not None:
+            hit = cache.lookup(key)
+            if hit is not None:
+                output, variables = hit
+                self.namespace.update(variables)
+                self.result(index, "ok", output, cached=True)
+                return None
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self.run_child(index, write_fd)
+        os.close(write_fd)
+        return Child(index, pid, read_fd, key)
+
+    def run_child(self, index, write_fd):
+        try:
+            _die_with_parent()
+            # the child must never speak the kernel protocol, and should not keep the GUI pipes open
+            os.close(self.kernel.proto_in.fileno())
+            os.close(self.kernel.proto_out.fileno())
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+            status, output = self.run_cell(self.cells[index])
+            metrics = self.kernel.capture.last_metrics
+            defines = self.infos[index].defines if self.infos[index] is not None else ()
+            try:
+                variables = {name: dump_value(self.namespace[name]) for name in defines if name in self.namespace}
+                payload = pickle.dumps({"status": status, "output": output, "variables": variables, "metrics": metrics},
+                                       protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                payload = pickle.dumps({"status": status, "output": output, "variables": None, "metrics": metrics},
+                                       protocol=pickle.HIGHEST_PROTOCOL)
+
+            view = memoryview(payload)
+            while view:
+                written = os.write(write_fd, view)
+                view = view[written:]
+        finally:
+            os._exit(0)
+
+    def finish(self, child):
+        cell = self.cells[child.index]
+        try:
+            result = pickle.loads(b"".join(child.chunks))
+        except Exception:
+            # running it here would most likely take the kernel down as well
+            self.result(child.index, "error", f"The worker running this cell crashed (wait status {child.status})")
+            return
+
+        try:
+            variables = result["variables"]
+            if variables is not None:
+                variables = {name: load_value(stored) for name, stored in variables.items()}
+        except Exception:
+            variables = None
+
+        if variables is None:
+            # results did not survive the trip, run the cell here instead
+            status, output = self.run_cell(cell)
+            metrics = self.kernel.capture.last_metrics
+        else:
+            status, output, metrics = result["status"], result["output"], result["metrics"]
+            self.namespace.update(variables)
+
+        if child.key is not None and status == "ok":
+            self.kernel.cache_for(cell.get("cache_dir")).store(child.key, cell["code"], output, self.namespace)
+        self.result(child.index, status, output, metrics=metrics)
@@ -0,0 +1,115 @@
+# pipelineTrace.py
+"""
+Timestamped spans of the path a cell takes, from the key press through the kernel
+and back to its output on screen, exported as Chrome trace event JSON (open it in
+Perfetto or chrome://tracing).
+
+Recording is off until start() is called. Every hook checks `enabled` first, so
+instrumented code pays one global lookup while it is off. The GUI and the kernel
+record in their own process; the kernel sends its events back with the result of
+each traced request and the GUI merges them with add(). Times are
+time.monotonic(), one clock for every process on the machine.
+
+This module only imports the standard library, the kernel uses it too.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+MAX_EVENTS = 1_000_000  # recording stops growing here, a forgotten trace must not eat the memory
+
+enabled = False
+events = []
+_names = set()  # (pid, tid) whose thread name was recorded
+_null = contextlib.nullcontext()
+
+
+def start():
+    """Throw away what was recorded and record from now on."""
+    global enabled
+    events.clear()
+    _names.clear()
+    enabled = True
+
+
+def stop():
+    global enabled
+    enabled = False
+
+
+def _record(event):
+    if len(events) >= MAX_EVENTS:
+        return
+    pid, tid = os.getpid(), threading.get_native_id()
+    if (pid, tid) not in _names:
+        _names.add((pid, tid))
+        events.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": threading.current_thread().name}})
+    event["pid"], event["tid"] = pid, tid
+    events.append(event)
+
+
+def _us(seconds):
+    return round(seconds * 1_000_000)
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "begin")
+
+    def __init__(self, name, cat, args):
+        self.name, self.cat, self.args = name, cat, args
+
+    def __enter__(self):
+        self.begin = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        complete(self.name, self.begin, cat=self.cat, **self.args)
+        return False
+
+
+def span(name, cat="gui", **args):
+    """Context manager recording the time spent inside it."""
+    if not enabled:
+        return _null
+    return _Span(name, cat, args)
+
+
+def complete(name, begin, end=None, cat="gui", **args):
+    """Record a span that began at begin (time.monotonic()), e.g. time spent waiting in a queue."""
+    if not enabled:
+        return
+    end = time.monotonic() if end is None else end
+    _record({"ph": "X", "name": name, "cat": cat, "ts": _us(begin), "dur": _us(end - begin), "args": args})
+
+
+def instant(name, cat="gui", **args):
+    if not enabled:
+        return
+    _record({"ph": "i", "s": "t", "name": name, "cat": cat, "ts": _us(time.monotonic()), "args": args})
+
+
+def name_process(name):
+    """Label this process in the trace, e.g. "Pydonia GUI"."""
+    if enabled:
+        events.append({"ph": "M", "name": "process_name", "pid": os.getpid(), "args": {"name": name}})
+
+
+def drain():
+    """Hand out what was recorded so far and forget it."""
+    taken = events[:]
+    del events[:len(taken)]
+    _names.clear()
+    return taken
+
+
+def add(other_events):
+    """Merge events recorded by another process."""
+    if enabled:
+        events.extend(other_events[:max(0, MAX_EVENTS - len(events))])
+
+
+def export(path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,179 @@
+import marshal
+import os
+
+from PyQt6 import QtCore, QtWidgets
+
+SORT_ROLE = QtCore.Qt.ItemDataRole.UserRole
+FUNC_ROLE = QtCore.Qt.ItemDataRole.UserRole + 1
+
+
+def save_pstats(stats, path):
+    """Write stats the way pstats.Stats.dump_stats does, for pstats, snakeviz and friends."""
+    with open(path, "wb") as f:
+        marshal.dump(stats, f)
+
+
+def function_name(func):
+    filename, _, name = func
+    if filename == "~":
+        # built-ins have no location, their name says what they are
+        return name.strip("<>")
+    return name
+
+
+def function_location(func):
+    filename, line, _ = func
+    if filename == "~":
+        return ""
+    if filename.startswith("<"):
+        return filename.strip("<>")
+    return f"{os.path.basename(filename)}:{line}"
+
+
+def format_time(seconds):
+    return f"{seconds * 1000:.1f} ms" if seconds < 1 else f"{seconds:.3f} s"
+
+
+class ProfileItem(QtWidgets.QTreeWidgetItem):
+    """Sorts numeric columns by the number behind the text."""
+
+    def __lt__(self, other):
+        column = self.treeWidget().sortColumn()
+        mine, theirs = self.data(column, SORT_ROLE), other.data(column, SORT_ROLE)
+        if mine is not None and theirs is not None:
+            return mine < theirs
+        return self.text(column) < other.text(column)
+
+
+class ProfileView(QtWidgets.QWidget):
+    """
+    A cell's profile (see cellProfiler.CellProfiler.result): the call tree below the cell with the
+    time spent in each call and its callees (Total) and in the function itself (Own), every
+    function on its own, and the sampled stacks if there are any.
+
+    Call tree children are created when their parent is first expanded, recursion would make
+    the whole tree endless. The times under a function are those of its callees when called from
+    that function, wherever that function itself was called from (what cProfile records).
+    """
+    TREE_COLUMNS = ["Function", "Calls", "Total", "Own", "% Total", "Location"]
+    SAMPLE_COLUMNS = ["Function", "Samples", "~Time", "% Samples", "Location"]
+
+    def __init__(self, profile, default_path="profile.pstats", parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self.default_path = default_path
+        self.stats = profile["stats"]
+
+        # caller -> {callee: (calls, primitive calls, own time, total time) of the callee from there}
+        self.callees = {}
+        for func, (_, _, _, _, callers) in self.stats.items():
+            for caller, edge in callers.items():
+                self.callees.setdefault(caller, {})[func] = edge
+
+        self.roots = [func for func in self.stats if func[0] == profile["filename"] and func[2] == "<module>"]
+        if not self.roots:
+            self.roots = [func for func, entry in self.stats.items() if not entry[4]]
+        self.total = sum(self.stats[func][3] for func in self.roots) or 1e-9
+
+        self.tree = self._make_tree(self.TREE_COLUMNS)
+        self.tree.itemExpanded.connect(self._expand)
+        for func in self.roots:
+            cc, nc, tt, ct, _ = self.stats[func]
+            self.tree.addTopLevelItem(self._call_item(func, nc, cc, tt, ct))
+        self.tree.sortItems(2, QtCore.Qt.SortOrder.DescendingOrder)
+        for i in range(self.tree.topLevelItemCount()):
+            self.tree.topLevelItem(i).setExpanded(True)
+
+        self.functions = self._make_tree(self.TREE_COLUMNS)
+        self.functions.setRootIsDecorated(False)
+        for func, (cc, nc, tt, ct, _) in self.stats.items():
+            self.functions.addTopLevelItem(self._call_item(func, nc, cc, tt, ct, expandable=False))
+        self.functions.sortItems(3, QtCore.Qt.SortOrder.DescendingOrder)
+
+        self.tabs = QtWidgets.QTabWidget()
+        self.tabs.addTab(self.tree, "Call Tree")
+        self.tabs.addTab(self.functions, "Functions")
+        if profile["samples"]:
+            self.tabs.addTab(self._sample_tree(), "Samples")
+
+        calls = sum(entry[1] for entry in self.stats.values())
+        summary = QtWidgets.QLabel(f"{calls} calls in {format_time(self.total)}")
+        save_button = QtWidgets.QPushButton("Save .pstats...")
+        save_button.clicked.connect(self.save)
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(summary)
+        buttons.addStretch()
+        buttons.addWidget(save_button)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addLayout(buttons)
+        layout.addWidget(self.tabs)
+
+    def _make_tree(self, columns):
+        tree = QtWidgets.QTreeWidget()
+        tree.setColumnCount(len(columns))
+        tree.setHeaderLabels(columns)
+        tree.setSortingEnabled(True)
+        tree.setUniformRowHeights(True)
+        tree.header().setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeMode.Stretch)
+        tree.header().setStretchLastSection(False)
+        return tree
+
+    def _call_item(self, func, calls, primitive, own, total, expandable=True):
+        calls_text = str(calls) if calls == primitive else f"{calls}/{primitive}"
+        item = ProfileItem([function_name(func), calls_text, format_time(total), format_time(own),
+                            f"{100 * total / self.total:.1f}", function_location(func)])
+        for column, value in ((1, calls), (2, total), (3, own), (4, total)):
+            item.setData(column, SORT_ROLE, value)
+            item.setTextAlignment(column, QtCore.Qt.AlignmentFlag.AlignRight)
+        item.setData(0, FUNC_ROLE, func)
+        item.setToolTip(0, f"{func[0]}:{func[1]} {func[2]}")
+        if expandable and self.callees.get(func):
+            item.setChildIndicatorPolicy(QtWidgets.QTreeWidgetItem.ChildIndicatorPolicy.ShowIndicator)
+        return item
+
+    def _expand(self, item):
+        if item.childCount():
+            return
+        func = item.data(0, FUNC_ROLE)
+        for callee, (nc, cc, tt, ct) in self.callees.get(func, {}).items():
+            item.addChild(self._call_item(callee, nc, cc, tt, ct))
+
+    def _sample_tree(self):
+        tree = self._make_tree(self.SAMPLE_COLUMNS)
+        interval = self.profile["interval"]
+        total = sum(count for _, count in self.profile["samples"])
+
+        # merge the stacks into a tree of [count, children] by function
+        top = {}
+        for stack, count in self.profile["samples"]:
+            level = top
+            for func in stack:
+                node = level.setdefault(func, [0, {}])
+                node[0] += count
+                level = node[1]
+
+        def add(parent, level):
+            for func, (count, children) in level.items():
+                item = ProfileItem([function_name(func), str(count), format_time(count * interval),
+                                    f"{100 * count / total:.1f}", function_location(func)])
+                for column, value in ((1, count), (2, count), (3, count)):
+                    item.setData(column, SORT_ROLE, value)
+                    item.setTextAlignment(column, QtCore.Qt.AlignmentFlag.AlignRight)
+                item.setToolTip(0, f"{func[0]}:{func[1]} {func[2]}")
+                parent.addChild(item)
+                add(item, children)
+
+        add(tree.invisibleRootItem(), top)
+        tree.sortItems(1, QtCore.Qt.SortOrder.DescendingOrder)
+        tree.expandToDepth(1)
+        return tree
+
+    def save(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save Profile", self.default_path, "Profile (*.pstats *.prof)")
+        if not path:
+            return
+        try:
+            save_pstats(self.stats, path)
+        except Exception as e:
+            QtWidgets.QMessageBox.critical(self, "Save Error", f"Could not save profile:\n{e}")
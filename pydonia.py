@@ -0,0 +1,224 @@
+# pydonia.py
+"""
+Command line entry point, for running notebooks without the GUI:
+
+    python -m pydonia run notebook.py [more.py ...] [-j 4] [-o results.json]
+
+Every notebook gets its own kernel process (kernel.py, spoken to directly over
+its pipes, no Qt involved) that runs the preamble and then each cell in order,
+as Run All in the GUI does. Up to --jobs notebooks run at the same time. The
+outputs, errors and metrics of every cell are written as JSON; --compare checks
+them against an earlier run's JSON and reports every cell whose output changed.
+
+The exit status is 0 when every cell ran and nothing changed, 1 otherwise.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import kernel
+from codeCache import code_cache_dir_for
+from notebookModel import Notebook
+
+KERNEL_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel.py")
+
+
+class HeadlessKernel:
+    """A kernel process driven one request at a time from a plain thread."""
+
+    def __init__(self, kill_grace=3.0):
+        self.proc = subprocess.Popen([sys.executable, KERNEL_SCRIPT], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.kill_grace = kill_grace
+        self.send_lock = threading.Lock()
+        self.next_id = 1
+        self.timed_out = False
+        self.answered = threading.Event()
+
+    def send(self, msg):
+        with self.send_lock:
+            try:
+                kernel.write_frame(self.proc.stdin, msg)
+            except (BrokenPipeError, OSError, ValueError):
+                # the next read sees the kernel is gone
+                pass
+
+    def execute(self, code, filename, code_dir=None, timeout=None):
+        """Run one cell and return its result message, or None if the kernel died."""
+        msg_id = self.next_id
+        self.next_id += 1
+        self.timed_out = False
+        self.answered = threading.Event()
+        self.send({"type": "execute", "id": msg_id, "code": code, "filename": filename, "code_dir": code_dir})
+
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, self._on_timeout, (msg_id,))
+            timer.daemon = True
+            timer.start()
+        try:
+            while True:
+                try:
+                    msg = kernel.read_frame(self.proc.stdout)
+                except Exception:
+                    msg = None
+                if msg is None:
+                    return None
+                if msg.get("type") == "result" and msg.get("id") == msg_id:
+                    return msg
+        finally:
+            self.answered.set()
+            if timer is not None:
+                timer.cancel()
+
+    def _on_timeout(self, msg_id):
+        self.timed_out = True
+        answered = self.answered
+        self.send({"type": "interrupt", "id": msg_id})
+        # code stuck in C never sees the KeyboardInterrupt
+        if not answered.wait(self.kill_grace):
+            self.proc.kill()
+
+    def shutdown(self):
+        self.send({"type": "shutdown"})
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+def run_notebook(path, timeout=None, stop_on_error=False):
+    """Run a notebook from scratch, returns what happened to it as a JSON ready dict."""
+    start = time.monotonic()
+    result = {"notebook": path, "status": "ok", "preamble": None, "cells": []}
+    try:
+        notebook = Notebook.load(path)
+    except Exception as e:
+        result.update(status="error", error=f"Failed to open file: {e}", wall=0.0)
+        return result
+    result["warnings"] = notebook.warnings
+
+    name = os.path.basename(path)
+    code_dir = code_cache_dir_for(path)
+    runs = [("preamble", f"<{name} preamble>", notebook.preamble)]
+    runs += [(index, f"<{name} cell {index + 1}>", cell.source) for index, cell in enumerate(notebook)]
+
+    headless = HeadlessKernel()
+    skipping = None  # why the remaining cells do not run
+    try:
+        for index, filename, code in runs:
+            entry = {"index": index, "status": "skipped", "output": skipping or "", "metrics": {}}
+            if skipping is None:
+                reply = headless.execute(code, filename, code_dir, timeout)
+                if reply is None:
+                    exit_code = headless.proc.wait()
+                    if headless.timed_out:
+                        entry.update(status="error", output=f"Stopped: the cell ran longer than the {timeout:g} s time limit and ignored the interrupt")
+                    else:
+                        entry.update(status="error", output=f"Kernel died (exit code {exit_code})")
+                    skipping = "Kernel died"
+                else:
+                    entry.update(status=reply["status"], output=reply["output"], metrics=reply.get("metrics", {}))
+                    if headless.timed_out:
+                        entry.update(status="error", output=entry["output"] + f"\nStopped: the cell ran longer than the {timeout:g} s time limit")
+
+                if entry["status"] != "ok":
+                    result["status"] = "error"
+                    if stop_on_error and skipping is None:
+                        skipping = f"Skipped: {filename.strip('<>')} failed"
+
+            if index == "preamble":
+                result["preamble"] = entry
+            else:
+                result["cells"].append(entry)
+    finally:
+        headless.shutdown()
+
+    result["wall"] = time.monotonic() - start
+    return result
+
+
+def compare(results, previous):
+    """Cells whose status or output differ from a previous run, as (notebook, index, what) tuples."""
+    before = {entry["notebook"]: entry for entry in previous.get("notebooks", [])}
+    changes = []
+    for result in results:
+        old = before.get(result["notebook"])
+        if old is None:
+            changes.append((result["notebook"], None, "not in the previous run"))
+            continue
+        old_cells, new_cells = old.get("cells", []), result.get("cells", [])
+        if len(old_cells) != len(new_cells):
+            changes.append((result["notebook"], None, f"{len(old_cells)} cells before, {len(new_cells)} now"))
+        for old_cell, new_cell in zip(old_cells, new_cells):
+            if old_cell["status"] != new_cell["status"]:
+                changes.append((result["notebook"], new_cell["index"], f"{old_cell['status']} before, {new_cell['status']} now"))
+            elif old_cell["output"] != new_cell["output"]:
+                changes.append((result["notebook"], new_cell["index"], "output changed"))
+    return changes
+
+
+def run(args):
+    paths = [os.path.abspath(path) for path in args.notebooks]
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        # each thread only waits on its notebook's kernel process, the work runs in parallel there
+        futures = {pool.submit(run_notebook, path, args.timeout, args.stop_on_error): path for path in paths}
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            failed = sum(1 for cell in result["cells"] if cell["status"] == "error")
+            print(f"{result['status']:<6} {os.path.relpath(result['notebook'])}  {len(result['cells'])} cells"
+                  f"{f', {failed} failed' if failed else ''}  {result['wall']:.1f} s", file=sys.stderr)
+
+    ordered = [results[path] for path in paths]
+    report = {"created": time.time(), "python": sys.version.split()[0], "notebooks": ordered}
+    text = json.dumps(report, indent=1)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    exit_code = 0 if all(result["status"] == "ok" for result in ordered) else 1
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            changes = compare(ordered, json.load(f))
+        for notebook, index, what in changes:
+            where = os.path.relpath(notebook) + ("" if index is None else f" cell {index + 1}")
+            print(f"changed {where}: {what}", file=sys.stderr)
+        if changes:
+            exit_code = 1
+    return exit_code
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pydonia", description="Run Pydonia notebooks without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run notebooks and write their outputs as JSON")
+    run_parser.add_argument("notebooks", nargs="+", help="notebook .py files")
+    run_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="notebooks to run at the same time (default: one per CPU)")
+    run_parser.add_argument("-o", "--output", default="-", help="where to write the JSON (default: standard output)")
+    run_parser.add_argument("--timeout", type=float, default=None, help="seconds a cell may run before it is interrupted")
+    run_parser.add_argument("--stop-on-error", action="store_true", help="skip the rest of a notebook after a failing cell")
+    run_parser.add_argument("--compare", metavar="PREVIOUS", help="JSON of an earlier run, report every cell whose output changed")
+    run_parser.set_defaults(handler=run)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "jobs", 1) < 1:
+        parser.error("--jobs must be at least 1")
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,13 @@
 from PyQt6.QtCore import Qt, pyqtSignal
-from PyQt6.QtWidgets import QTextEdit
+from PyQt6.QtWidgets import QPlainTextEdit
 from PyQt6.uic.Compiler.qtproxies import QtWidgets
 
+import pipelineTrace
 
-class TextEdit(QTextEdit):
-    cellRunRequest = pyqtSignal(QTextEdit)
-    deleteRequested = pyqtSignal(QTextEdit) # cannot use QtWidgets.QWidget because QWidget is an ancestor not a parent
+
+class TextEdit(QPlainTextEdit):
+    cellRunRequest = pyqtSignal(QPlainTextEdit)
+    deleteRequested = pyqtSignal(QPlainTextEdit) # cannot use QtWidgets.QWidget because QWidget is an ancestor not a parent
 
     def __init__(self):
         super().__init__()
@@ -15,7 +17,8 @@ class TextEdit(QTextEdit):
 
         # Check if Shift + Enter is pressed
         if event.modifiers() == Qt.KeyboardModifier.ShiftModifier and event.key() == Qt.Key.Key_Return:
-            self.cellRunRequest.emit(self)
+            with pipelineTrace.span("Shift+Enter", "input"):
+                self.cellRunRequest.emit(self)
             event.accept()
             return
         elif event.modifiers() == Qt.KeyboardModifier.ShiftModifier and event.key() == Qt.Key.Key_Backspace: